@@ -0,0 +1,126 @@
+# admission.py
+import asyncio
+import heapq
+import itertools
+import os
+from contextlib import asynccontextmanager
+from metrics import SHED, metrics
+
+MAX_SESSIONS_PER_WORKER = int(os.getenv("MAX_SESSIONS_PER_WORKER", "50"))  # concurrent /ws/audio connections
+MAX_INFLIGHT_ASR = int(os.getenv("MAX_INFLIGHT_ASR", "32"))  # ASR requests waiting for a batch
+MAX_INFLIGHT_TTS = int(os.getenv("MAX_INFLIGHT_TTS", "8"))  # TTS syntheses running at once
+MAX_QUEUED_TTS = int(os.getenv("MAX_QUEUED_TTS", "32"))  # TTS syntheses waiting for a slot
+BUSY_RETRY_SECONDS = 5
+
+# Lower runs first
+PRIORITY_FINAL = 0     # the utterance or sentence a caller is waiting on
+PRIORITY_FOLLOWUP = 1  # later sentences of a reply
+PRIORITY_PARTIAL = 2   # live partial transcripts, nice to have
+PRIORITY_PREWARM = 3   # cache warming
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing work a stage has no room for."""
+
+    def __init__(self, stage):
+        super().__init__(f"{stage} is overloaded")
+        self.stage = stage
+
+
+class BoundedPriorityQueue:
+    """
+    A priority queue with room for `maxsize` items. When full, a new item
+    displaces the lowest-priority queued item if it outranks it (the caller
+    gets the displaced item back to fail it) and is refused with Overloaded
+    otherwise. Items that `is_stale` reports as abandoned are purged first.
+    """
+
+    def __init__(self, maxsize, stage, is_stale=None):
+        self.maxsize = maxsize
+        self.stage = stage
+        self.is_stale = is_stale
+        self._heap = []
+        self._counter = itertools.count()
+        self._not_empty = asyncio.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put_nowait(self, item, priority=PRIORITY_FINAL):
+        displaced = None
+        if len(self._heap) >= self.maxsize and self.is_stale:
+            self._heap = [entry for entry in self._heap if not self.is_stale(entry[2])]
+            heapq.heapify(self._heap)
+        if len(self._heap) >= self.maxsize:
+            worst = max(self._heap) if self._heap else None
+            if worst is None or worst[0] <= priority:
+                SHED.labels(self.stage).inc()
+                raise Overloaded(self.stage)
+            self._heap.remove(worst)
+            heapq.heapify(self._heap)
+            SHED.labels(self.stage).inc()
+            displaced = worst[2]
+        heapq.heappush(self._heap, (priority, next(self._counter), item))
+        self._not_empty.set()
+        return displaced
+
+    def pop_nowait(self):
+        return heapq.heappop(self._heap)[2]
+
+    async def get(self):
+        while not self._heap:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.pop_nowait()
+
+
+class PriorityLimiter:
+    """
+    Runs at most `limit` jobs at once; up to `max_waiting` more wait for a
+    slot in priority order, and anything beyond that is refused (or
+    displaces a lower-priority waiter) with Overloaded.
+    """
+
+    def __init__(self, limit, max_waiting, stage):
+        self.limit = limit
+        self.stage = stage
+        self.active = 0
+        self._waiters = BoundedPriorityQueue(max_waiting, stage, is_stale=lambda future: future.done())
+
+    def _wake_next(self):
+        while self._waiters and self.active < self.limit:
+            future = self._waiters.pop_nowait()
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_FINAL):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            displaced = self._waiters.put_nowait(future, priority)
+            if displaced is not None and not displaced.done():
+                displaced.set_exception(Overloaded(self.stage))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Granted just as we were cancelled: pass the slot on
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    self.active -= 1
+                    self._wake_next()
+                raise
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._wake_next()
+
+
+tts_limiter = PriorityLimiter(MAX_INFLIGHT_TTS, MAX_QUEUED_TTS, "tts")
+# Connections don't wait for a line: with no room to queue, the one over the limit is refused
+connection_limiter = PriorityLimiter(MAX_SESSIONS_PER_WORKER, 0, "session")
+
+metrics.gauge("voice_tts_active", "TTS syntheses running.", function=lambda: tts_limiter.active)
+metrics.gauge("voice_tts_waiting", "TTS syntheses waiting for a slot.", function=lambda: len(tts_limiter._waiters))
@@ -0,0 +1,204 @@
+# asr.py
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from admission import MAX_INFLIGHT_ASR, PRIORITY_FINAL, PRIORITY_PARTIAL, BoundedPriorityQueue, Overloaded
+from metrics import ASR_BATCH_REQUESTS, ASR_QUEUE_WAIT_SECONDS, ASR_RTF, ASR_SECONDS
+
+ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", "8"))
+ASR_BATCH_WAIT_MS = float(os.getenv("ASR_BATCH_WAIT_MS", "10"))  # how long to wait for more requests
+ASR_PARTIAL_INTERVAL = float(os.getenv("ASR_PARTIAL_INTERVAL", "1.0"))  # seconds of new audio between passes
+ASR_STABLE_MARGIN = float(os.getenv("ASR_STABLE_MARGIN", "1.0"))  # segments ending this close to the edge stay open
+
+
+class StreamingTranscriber:
+    """
+    Transcribes a growing utterance while it is still being spoken.
+
+    Each partial pass decodes the audio after the committed point. Segments
+    that end well before the edge of the window will not change as more
+    audio arrives, so their text is committed and the window start moves
+    past them. The final pass then only has to decode the uncommitted tail.
+
+    `transcribe` is an async callable taking (samples, **options) and
+    returning a Whisper-style result dict.
+    """
+
+    def __init__(self, transcribe, sample_rate=16000, interval=ASR_PARTIAL_INTERVAL,
+                 stable_margin=ASR_STABLE_MARGIN):
+        self._transcribe = transcribe
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.stable_margin = stable_margin
+        self._task = None
+        self.reset()
+
+    def reset(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self.committed_text = ""
+        self.committed_samples = 0
+        self._last_partial_len = 0
+        self._last_partial_text = None
+
+    def should_update(self, n_samples):
+        if self._task and not self._task.done():
+            return False
+        return n_samples - self._last_partial_len >= self.interval * self.sample_rate
+
+    def start_partial(self, samples, on_text):
+        """Runs a partial pass in the background and hands its text to on_text."""
+        self._last_partial_len = len(samples)
+        self._task = asyncio.create_task(self._run_partial(samples, on_text))
+
+    async def _run_partial(self, samples, on_text):
+        try:
+            text = await self.partial(samples)
+        except asyncio.CancelledError:
+            raise
+        except Overloaded:
+            return  # partials are the first thing shed under load
+        except Exception as e:
+            print("⚠️ Partial transcription failed:", e)
+            return
+        if text:
+            await on_text(text)
+
+    def _prompt(self):
+        return self.committed_text.strip() or None
+
+    async def partial(self, samples):
+        window = samples[self.committed_samples:]
+        result = await self._transcribe(window, initial_prompt=self._prompt(), priority=PRIORITY_PARTIAL)
+        segments = result.get("segments") or []
+        window_end = len(window) / self.sample_rate
+
+        commit_end = 0.0
+        open_segments = segments
+        for i, seg in enumerate(segments[:-1]):
+            if seg["end"] > window_end - self.stable_margin:
+                break
+            self.committed_text += seg["text"]
+            commit_end = seg["end"]
+            open_segments = segments[i + 1:]
+        self.committed_samples += int(commit_end * self.sample_rate)
+
+        if segments:
+            tail = "".join(seg["text"] for seg in open_segments)
+        else:
+            tail = result.get("text", "")
+        text = (self.committed_text + tail).strip()
+        self._last_partial_text = text
+        return text
+
+    async def final(self, samples):
+        # Let an in-flight partial finish so the committed point is consistent
+        if self._task and not self._task.done():
+            try:
+                await self._task
+            except Exception:
+                pass
+        if self._last_partial_text is not None and self._last_partial_len == len(samples):
+            return self._last_partial_text
+
+        # Read once: a reset while the tail is decoded must not drop the committed prefix
+        committed_text, prompt = self.committed_text, self._prompt()
+        window = samples[self.committed_samples:]
+        result = await self._transcribe(window, initial_prompt=prompt, priority=PRIORITY_FINAL)
+        return (committed_text + result.get("text", "")).strip()
+
+
+class BatchedASRWorker:
+    """
+    Single inference service shared by all sessions. Requests are queued,
+    and the ones arriving within ASR_BATCH_WAIT_MS of each other are handed
+    to the ASR backend as one batch; results resolve each caller's future.
+
+    Inference runs on one dedicated thread so batches never contend for
+    the model. `get_backend` is called per batch, so the backend can load
+    after import.
+
+    At most `max_queue` requests wait at once. Final passes are served
+    before partials, and when the queue is full a final displaces a queued
+    partial; whatever doesn't fit fails with Overloaded.
+    """
+
+    def __init__(self, get_backend, batch_size=ASR_BATCH_SIZE, batch_wait_ms=ASR_BATCH_WAIT_MS,
+                 max_queue=MAX_INFLIGHT_ASR):
+        self.get_backend = get_backend
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr")
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._queue = BoundedPriorityQueue(self.max_queue, "asr", is_stale=lambda item: item[2].done())
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def transcribe(self, samples, initial_prompt=None, priority=PRIORITY_FINAL, **_):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        displaced = self._queue.put_nowait((samples, initial_prompt, future, time.perf_counter()), priority)
+        if displaced is not None and not displaced[2].done():
+            displaced[2].set_exception(Overloaded("asr"))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Callers that gave up while queued don't need a slot in the batch
+        batch = [item for item in batch if not item[2].done()]
+        now = time.perf_counter()
+        for *_, enqueued_at in batch:
+            ASR_QUEUE_WAIT_SECONDS.observe(now - enqueued_at)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._infer, [(samples, prompt) for samples, prompt, *_ in batch]
+                )
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _infer(self, requests):
+        backend = self.get_backend()
+        start = time.perf_counter()
+        results = backend.transcribe_batch(requests)
+        compute_seconds = time.perf_counter() - start
+        audio_seconds = sum(len(samples) for samples, _ in requests) / 16000
+        backend.record(audio_seconds, compute_seconds)
+        ASR_SECONDS.labels(backend.name).observe(compute_seconds)
+        ASR_BATCH_REQUESTS.observe(len(requests))
+        if audio_seconds:
+            ASR_RTF.labels(backend.name).observe(compute_seconds / audio_seconds)
+        return results
@@ -0,0 +1,215 @@
+# asr_backends.py
+import os
+import threading
+import numpy as np
+import torch
+import whisper
+from whisper.tokenizer import get_tokenizer
+
+ASR_BACKEND = os.getenv("ASR_BACKEND", "whisper")  # "whisper", "whisper-int8" or "ctranslate2"
+ASR_THREADS = int(os.getenv("ASR_THREADS", str(os.cpu_count() or 1)))
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+SAMPLE_RATE = 16000
+
+# whisper.transcribe()'s safeguards, which a bare decode() doesn't apply
+WHISPER_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)  # retried in turn while a decode looks degenerate
+COMPRESSION_RATIO_THRESHOLD = 2.4  # above this the text is repeating itself
+LOGPROB_THRESHOLD = -1.0  # below this average log-probability the decode is unsure
+NO_SPEECH_THRESHOLD = 0.6  # with an unsure decode, above this the audio is taken as silence
+
+
+def backend_threads(name):
+    # ASR_THREADS_WHISPER_INT8=4 overrides ASR_THREADS for one backend
+    return int(os.getenv("ASR_THREADS_" + name.upper().replace("-", "_"), str(ASR_THREADS)))
+
+
+class ASRBackend:
+    """
+    A speech recognition engine. `transcribe_batch` takes a list of
+    (float32 16 kHz samples, prompt) pairs and returns one Whisper-style
+    result dict ({"text", "segments"}) per request.
+
+    Backends also keep their real-time factor: compute time divided by the
+    duration of audio processed (below 1.0 is faster than real time).
+    """
+
+    name = None
+
+    def __init__(self, model_name=WHISPER_MODEL, threads=None, language="en"):
+        self.model_name = model_name
+        self.threads = threads or backend_threads(self.name)
+        self.language = language
+        self.audio_seconds = 0.0
+        self.compute_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def load(self):
+        raise NotImplementedError
+
+    def transcribe_batch(self, requests):
+        raise NotImplementedError
+
+    def record(self, audio_seconds, compute_seconds):
+        with self._stats_lock:
+            self.audio_seconds += audio_seconds
+            self.compute_seconds += compute_seconds
+
+    @property
+    def rtf(self):
+        return self.compute_seconds / self.audio_seconds if self.audio_seconds else None
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "threads": self.threads,
+            "audio_seconds": round(self.audio_seconds, 3),
+            "compute_seconds": round(self.compute_seconds, 3),
+            "rtf": round(self.rtf, 4) if self.rtf is not None else None,
+        }
+
+
+class WhisperBackend(ASRBackend):
+    """
+    openai-whisper in PyTorch. A batch is padded to Whisper's 30 s window and
+    run through the encoder once, then decoded per prompt group. Like
+    whisper.transcribe(), decodes that repeat themselves or are unsure are
+    retried at rising temperatures; silence and decodes still repeating
+    after the last one come back as empty text.
+    """
+
+    name = "whisper"
+    TIME_PRECISION = 0.02  # seconds per Whisper timestamp token
+
+    def load(self):
+        torch.set_num_threads(self.threads)
+        self.model = whisper.load_model(self.model_name)
+        self.fp16 = self.model.device.type == "cuda"
+        self.tokenizer = get_tokenizer(self.model.is_multilingual, language=self.language, task="transcribe")
+
+    def transcribe_batch(self, requests):
+        n_mels = self.model.dims.n_mels
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(np.asarray(samples, np.float32))), n_mels)
+            for samples, _ in requests
+        ]).to(self.model.device)
+        if self.fp16:
+            mels = mels.half()
+
+        with torch.no_grad():
+            features = self.model.embed_audio(mels)
+
+            # decode() skips the encoder when handed audio features; prompts are per call, so group by prompt
+            groups = {}
+            for i, (_, prompt) in enumerate(requests):
+                groups.setdefault(prompt, []).append(i)
+            decoded = {}
+            for prompt, indices in groups.items():
+                decoded.update(self._decode_with_fallback(features, indices, prompt))
+
+        results = []
+        for i, (samples, _) in enumerate(requests):
+            result = decoded[i]
+            silent = result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+            if silent or result.compression_ratio > COMPRESSION_RATIO_THRESHOLD:
+                results.append({"text": "", "segments": []})
+                continue
+            results.append({"text": result.text, "segments": self._segments(result.tokens, len(samples) / SAMPLE_RATE)})
+        return results
+
+    def _decode_with_fallback(self, features, indices, prompt):
+        """Decodes features[indices], retrying the degenerate ones at the next temperature."""
+        decoded = {}
+        for temperature in WHISPER_TEMPERATURES:
+            options = whisper.DecodingOptions(language=self.language, task="transcribe", prompt=prompt,
+                                              fp16=self.fp16, temperature=temperature)
+            retry = []
+            for i, result in zip(indices, whisper.decode(self.model, features[indices], options)):
+                decoded[i] = result
+                degenerate = (result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                              or result.avg_logprob < LOGPROB_THRESHOLD)
+                # Silence isn't worth retrying
+                if degenerate and result.no_speech_prob <= NO_SPEECH_THRESHOLD:
+                    retry.append(i)
+            if not retry:
+                break
+            indices = retry
+        return decoded
+
+    def _segments(self, tokens, duration):
+        timestamp_begin = self.tokenizer.timestamp_begin
+        segments = []
+        text_tokens = []
+        start = 0.0
+        for token in tokens:
+            if token >= timestamp_begin:
+                t = (token - timestamp_begin) * self.TIME_PRECISION
+                if text_tokens:
+                    segments.append({"start": start, "end": t, "text": self.tokenizer.decode(text_tokens)})
+                    text_tokens = []
+                start = t
+            elif token < self.tokenizer.eot:
+                text_tokens.append(token)
+        if text_tokens:
+            segments.append({"start": start, "end": duration, "text": self.tokenizer.decode(text_tokens)})
+        return segments
+
+
+class WhisperInt8Backend(WhisperBackend):
+    """
+    The same model with its Linear layers dynamically quantized to int8.
+    CPU only; trades a little accuracy for a much cheaper encoder/decoder.
+    """
+
+    name = "whisper-int8"
+
+    def load(self):
+        torch.set_num_threads(self.threads)
+        model = whisper.load_model(self.model_name, device="cpu")
+        # Whisper's Linear subclass only adds dtype casting; make it a plain
+        # nn.Linear so quantize_dynamic recognizes and swaps it
+        for module in model.modules():
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+        self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.fp16 = False
+        self.tokenizer = get_tokenizer(self.model.is_multilingual, language=self.language, task="transcribe")
+
+
+class CTranslate2Backend(ASRBackend):
+    """
+    faster-whisper on CTranslate2 (optional dependency). ASR_COMPUTE_TYPE
+    picks the weight format, int8 by default. Requests in a batch are run
+    one after another; CTranslate2 parallelizes within each with its own
+    thread pool.
+    """
+
+    name = "ctranslate2"
+
+    def load(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError("ASR_BACKEND=ctranslate2 needs the faster-whisper package") from e
+        compute_type = os.getenv("ASR_COMPUTE_TYPE", "int8")
+        self.model = WhisperModel(self.model_name, device="cpu", compute_type=compute_type, cpu_threads=self.threads)
+
+    def transcribe_batch(self, requests):
+        results = []
+        for samples, prompt in requests:
+            segments, _ = self.model.transcribe(
+                np.asarray(samples, np.float32), language=self.language, task="transcribe",
+                initial_prompt=prompt, beam_size=1, condition_on_previous_text=False
+            )
+            segments = [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in segments]
+            results.append({"text": "".join(seg["text"] for seg in segments), "segments": segments})
+        return results
+
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend, WhisperInt8Backend, CTranslate2Backend)}
+
+
+def create_backend(name=ASR_BACKEND, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ASR_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
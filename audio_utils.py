@@ -0,0 +1,96 @@
+# audio_utils.py
+import math
+import os
+import numpy as np
+
+PCM_BUFFER_INITIAL_BYTES = int(os.getenv("PCM_BUFFER_INITIAL_BYTES", str(48000 * 2 * 2)))  # ~2s at 48kHz
+
+
+class PCMBuffer:
+    """
+    Growable byte buffer for incoming audio samples. Storage is preallocated and
+    doubled when full, so appending a frame is amortized O(1) and clearing
+    between turns keeps the allocation for the next utterance.
+    """
+
+    def __init__(self, capacity=PCM_BUFFER_INITIAL_BYTES):
+        self._buf = bytearray(capacity)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, data):
+        data = memoryview(data).cast("B")
+        n = len(data)
+        end = self._len + n
+        if end > len(self._buf):
+            new_capacity = max(end, len(self._buf) * 2)
+            self._buf.extend(bytes(new_capacity - len(self._buf)))
+        self._buf[self._len:end] = data
+        self._len = end
+
+    def getvalue(self):
+        return bytes(self._buf[:self._len])
+
+    def clear(self):
+        self._len = 0
+
+    def keep_tail(self, nbytes):
+        """Drops everything but the last nbytes, e.g. leading silence."""
+        if self._len > nbytes:
+            start = self._len - nbytes
+            self._buf[:nbytes] = self._buf[start:self._len]
+            self._len = nbytes
+
+
+class StreamingResampler:
+    """
+    Polyphase FIR resampler for int16 PCM that carries its filter history
+    across chunks, so a stream can be resampled frame by frame without
+    clicks at chunk boundaries. Output is float32 in [-1, 1], the format
+    both Silero and Whisper consume.
+    """
+
+    def __init__(self, input_rate, output_rate, taps_per_phase=16):
+        g = math.gcd(input_rate, output_rate)
+        self.up = output_rate // g
+        self.down = input_rate // g
+        self.taps_per_phase = taps_per_phase
+
+        # Windowed-sinc low-pass at the upsampled rate, cut off below the lower Nyquist
+        n_taps = taps_per_phase * self.up
+        cutoff = 0.5 / max(self.up, self.down)
+        t = np.arange(n_taps) - (n_taps - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n_taps, 8.0)
+        h *= self.up / h.sum()
+        # polyphase[p, k] = h[p + k * up]
+        self._polyphase = h.reshape(taps_per_phase, self.up).T.astype(np.float32)
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self._seen = 0  # input samples consumed so far
+        self._next_out = 0  # index of the next output sample
+
+    def process(self, pcm_int16):
+        x = np.frombuffer(pcm_int16, np.int16).astype(np.float32) / 32768.0
+        if not len(x) or self.up == self.down:
+            return x
+        signal = np.concatenate((self._history, x))
+        hist_len = len(self._history)
+        total_in = self._seen + len(x)
+
+        # Output n reads input sample (n * down) // up and the taps_per_phase - 1 before it
+        last_out = (total_in * self.up - 1) // self.down
+        n = np.arange(self._next_out, last_out + 1)
+        pos = n * self.down
+        phase = pos % self.up
+        base = pos // self.up - (self._seen - hist_len)
+        idx = base[:, None] - np.arange(self.taps_per_phase)[None, :]
+        out = np.einsum("nk,nk->n", signal[idx], self._polyphase[phase])
+
+        self._next_out = last_out + 1
+        self._seen = total_in
+        self._history = signal[-hist_len:].copy() if hist_len else signal[:0]
+        return out.astype(np.float32)
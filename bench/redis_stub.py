@@ -0,0 +1,199 @@
+# bench/redis_stub.py
+"""
+A local stand-in for Redis that speaks enough of its protocol for the
+session store (hashes, lists, TTLs and MULTI/EXEC), so several
+workers can share sessions offline:
+
+    python -m bench.redis_stub --port 6379
+
+then start the workers with SESSION_STORE_URL=redis://127.0.0.1:6379/0.
+"""
+import argparse
+import asyncio
+import time
+from session_store import RedisError
+
+
+class Status(str):
+    """A simple-string reply such as OK or QUEUED."""
+
+
+def encode_reply(value):
+    if isinstance(value, RedisError):
+        return b"-%s\r\n" % str(value).encode("utf-8")
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    if isinstance(value, Status):
+        return b"+%s\r\n" % value.encode("utf-8")
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+OK = Status("OK")
+QUEUED = Status("QUEUED")
+WRONGTYPE = RedisError("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+async def read_command(reader):
+    """Reads one RESP array of bulk strings; None once the client disconnects."""
+    try:
+        line = await reader.readuntil(b"\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # inline command, e.g. from telnet
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readuntil(b"\r\n"))[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+class RedisStub:
+    """
+    Keeps every database in memory. Keys expire lazily, when next touched,
+    like Redis's own passive expiry.
+    """
+
+    def __init__(self, password=None):
+        self.password = password
+        self.databases = {}
+        self.expires = {}
+        self.commands = 0
+
+    def _db(self, client):
+        return self.databases.setdefault(client["db"], {})
+
+    def _get(self, client, key, kind):
+        db = self._db(client)
+        expires = self.expires.get((client["db"], key))
+        if expires is not None and expires <= time.monotonic():
+            db.pop(key, None)
+            del self.expires[(client["db"], key)]
+        value = db.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise WRONGTYPE
+        return value
+
+    def _delete(self, client, key):
+        self.expires.pop((client["db"], key), None)
+        return self._db(client).pop(key, None) is not None
+
+    def run(self, client, name, args):
+        if name == "PING":
+            return Status(args[0].decode("utf-8")) if args else Status("PONG")
+        if name == "SELECT":
+            client["db"] = int(args[0])
+            return OK
+        if name == "DEL":
+            return sum(self._delete(client, key) for key in args if self._get(client, key, object) is not None)
+        if name == "EXPIRE":
+            if self._get(client, args[0], object) is None:
+                return 0
+            self.expires[(client["db"], args[0])] = time.monotonic() + int(args[1])
+            return 1
+        if name == "TTL":
+            if self._get(client, args[0], object) is None:
+                return -2
+            expires = self.expires.get((client["db"], args[0]))
+            return -1 if expires is None else max(int(expires - time.monotonic()), 0)
+        if name == "HSET":
+            fields = self._get(client, args[0], dict)
+            if fields is None:
+                fields = self._db(client)[args[0]] = {}
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in fields
+                fields[field] = value
+            return added
+        if name == "HGETALL":
+            fields = self._get(client, args[0], dict) or {}
+            return [part for item in fields.items() for part in item]
+        if name == "RPUSH":
+            items = self._get(client, args[0], list)
+            if items is None:
+                items = self._db(client)[args[0]] = []
+            items.extend(args[1:])
+            return len(items)
+        if name == "LRANGE":
+            items = self._get(client, args[0], list) or []
+            start, stop = int(args[1]), int(args[2])
+            stop = len(items) + stop if stop < 0 else stop
+            return items[start:stop + 1]
+        if name == "LTRIM":
+            items = self._get(client, args[0], list)
+            if items is not None:
+                start, stop = int(args[1]), int(args[2])
+                stop = len(items) + stop if stop < 0 else stop
+                items[:] = items[start:stop + 1]
+                if not items:
+                    self._delete(client, args[0])
+            return OK
+        return RedisError(f"ERR unknown command '{name}'")
+
+    async def handle(self, reader, writer):
+        client = {"db": 0, "authenticated": self.password is None, "queued": None}
+        try:
+            while (command := await read_command(reader)) is not None:
+                self.commands += 1
+                writer.write(encode_reply(self._dispatch(client, command)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, client, command):
+        name = command[0].decode("utf-8").upper()
+        args = command[1:]
+        if name == "AUTH":
+            client["authenticated"] = args[-1].decode("utf-8") == self.password
+            return OK if client["authenticated"] else RedisError("WRONGPASS invalid password")
+        if not client["authenticated"]:
+            return RedisError("NOAUTH Authentication required.")
+        if name == "MULTI":
+            client["queued"] = []
+            return OK
+        if name == "EXEC":
+            queued, client["queued"] = client["queued"], None
+            if queued is None:
+                return RedisError("ERR EXEC without MULTI")
+            return [self._run(client, queued_name, queued_args) for queued_name, queued_args in queued]
+        if client["queued"] is not None:
+            client["queued"].append((name, args))
+            return QUEUED
+        return self._run(client, name, args)
+
+    def _run(self, client, name, args):
+        try:
+            return self.run(client, name, args)
+        except RedisError as e:
+            return e
+        except (IndexError, ValueError):
+            return RedisError(f"ERR wrong number or type of arguments for '{name}'")
+
+
+async def start_redis_stub(stub, host="127.0.0.1", port=6379):
+    """Serves `stub` on the running loop and returns the server (call .close() to stop)."""
+    return await asyncio.start_server(stub.handle, host, port)
+
+
+async def _serve(args):
+    await start_redis_stub(RedisStub(args.password), args.host, args.port)
+    print(f"SESSION_STORE_URL=redis://{args.host}:{args.port}/0")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an in-memory Redis stand-in for the session store.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
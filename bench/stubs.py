@@ -0,0 +1,193 @@
+# bench/stubs.py
+"""
+Local stand-ins for the OpenAI chat-completions and ElevenLabs
+text-to-speech APIs with configurable latency, so the voice loop can be
+benchmarked offline and with repeatable upstream timings.
+
+    python -m bench.stubs --llm-ttft 0.4 --tts-ttfb 0.25
+
+then start the server with OPENAI_API_BASE=http://127.0.0.1:9101/v1 and
+ELEVENLABS_BASE_URL=http://127.0.0.1:9102.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from aiohttp import web
+
+DEFAULT_REPLY = "Thanks, got it. What is the street address of your business location?"
+
+
+class LLMStub:
+    """
+    Answers /v1/chat/completions. The first token arrives after `ttft`
+    seconds and each further token after `token_delay`; non-streaming
+    requests wait for the whole generation. Extraction prompts get `{}`,
+    summary prompts a fixed sentence, forced update_form calls get a tool
+    call, everything else gets `reply`.
+    """
+
+    def __init__(self, ttft=0.4, token_delay=0.02, reply=DEFAULT_REPLY):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.reply = reply
+        self.requests = 0
+
+    def _tokens(self, text):
+        words = text.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _usage(self, payload, tokens):
+        # Roughly four characters per prompt token
+        prompt = sum(len(str(m.get("content") or "")) for m in payload["messages"]) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": len(tokens), "total_tokens": prompt + len(tokens)}
+
+    def _tool_arguments(self, content):
+        return json.dumps({"fields": {}, "reply": content})
+
+    def _content(self, payload):
+        system = next((m["content"] for m in payload["messages"] if m["role"] == "system"), "")
+        if system.startswith("You extract structured form fields"):
+            return "{}"
+        if system.startswith("You keep the running memory"):
+            return "The user is answering the form questions one at a time."
+        return self.reply
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.requests += 1
+        content = self._content(payload)
+        tokens = self._tokens(content)
+        await asyncio.sleep(self.ttft)
+
+        if payload.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            if payload.get("tools"):
+                # Function calls stream their JSON arguments instead of content
+                tokens = self._tokens(self._tool_arguments(content))
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(self.token_delay)
+                delta = {"content": token}
+                if payload.get("tools"):
+                    delta = {"tool_calls": [{"index": 0, "function": {"arguments": token}}]}
+                chunk = {"choices": [{"index": 0, "delta": delta}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                chunk = {"choices": [], "usage": self._usage(payload, tokens)}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+
+        await asyncio.sleep(self.token_delay * (len(tokens) - 1))
+        message = {"role": "assistant", "content": content}
+        if payload.get("tools"):
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{self.requests}",
+                    "type": "function",
+                    "function": {"name": "update_form", "arguments": self._tool_arguments(content)}
+                }]
+            }
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": self._usage(payload, tokens)
+        })
+
+
+class TTSStub:
+    """
+    Answers /v1/text-to-speech/{voice_id}[/stream] with filler "audio"
+    sized like a 128 kbps MP3 of the text read at `chars_per_second`. The
+    first chunk arrives after `ttfb` seconds and the rest `chunk_delay`
+    apart.
+    """
+
+    def __init__(self, ttfb=0.25, chunk_delay=0.05, chunk_bytes=4096, chars_per_second=15.0):
+        self.ttfb = ttfb
+        self.chunk_delay = chunk_delay
+        self.chunk_bytes = chunk_bytes
+        self.chars_per_second = chars_per_second
+        self.requests = 0
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.requests += 1
+        seconds = max(len(payload.get("text", "")) / self.chars_per_second, 0.5)
+        audio = os.urandom(int(seconds * 16000))
+
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await asyncio.sleep(self.ttfb)
+        await response.prepare(request)
+        for offset in range(0, len(audio), self.chunk_bytes):
+            if offset:
+                await asyncio.sleep(self.chunk_delay)
+            await response.write(audio[offset:offset + self.chunk_bytes])
+        await response.write_eof()
+        return response
+
+
+def create_llm_app(stub):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stub.handle)
+    return app
+
+
+def create_tts_app(stub):
+    app = web.Application()
+    app.router.add_post("/v1/text-to-speech/{voice_id}", stub.handle)
+    app.router.add_post("/v1/text-to-speech/{voice_id}/stream", stub.handle)
+    return app
+
+
+async def start_stubs(llm_stub, tts_stub, host="127.0.0.1", llm_port=9101, tts_port=9102):
+    """Starts both stand-ins on the running loop and returns their runners (call .cleanup() to stop)."""
+    runners = []
+    for app, port in ((create_llm_app(llm_stub), llm_port), (create_tts_app(tts_stub), tts_port)):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+    return runners
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--llm-port", type=int, default=9101)
+    parser.add_argument("--tts-port", type=int, default=9102)
+    parser.add_argument("--llm-ttft", type=float, default=0.4, help="seconds to the first LLM token")
+    parser.add_argument("--llm-token-delay", type=float, default=0.02, help="seconds between LLM tokens")
+    parser.add_argument("--llm-reply", default=DEFAULT_REPLY)
+    parser.add_argument("--tts-ttfb", type=float, default=0.25, help="seconds to the first TTS audio chunk")
+    parser.add_argument("--tts-chunk-delay", type=float, default=0.05, help="seconds between TTS audio chunks")
+
+
+def stubs_from_args(args):
+    return (LLMStub(args.llm_ttft, args.llm_token_delay, args.llm_reply),
+            TTSStub(args.tts_ttfb, args.tts_chunk_delay))
+
+
+async def _serve(args):
+    llm_stub, tts_stub = stubs_from_args(args)
+    await start_stubs(llm_stub, tts_stub, args.host, args.llm_port, args.tts_port)
+    print(f"OPENAI_API_BASE=http://{args.host}:{args.llm_port}/v1")
+    print(f"ELEVENLABS_BASE_URL=http://{args.host}:{args.tts_port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve latency-controlled OpenAI and ElevenLabs stand-ins.")
+    add_stub_arguments(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
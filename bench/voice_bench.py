@@ -0,0 +1,248 @@
+# bench/voice_bench.py
+"""
+Replays recorded utterances through /ws/audio the way the browser does
+(48 kHz int16 frames at real-time pace) and measures each turn.
+
+    python -m bench.voice_bench --audio samples/*.wav
+    python -m bench.voice_bench --audio samples/*.wav --callers 20 --turns 5 --json results.json
+
+Utterances are .wav files (any rate, first channel) or raw .pcm files of
+48 kHz mono int16. The server reports its per-stage timings for each turn
+(resample, vad, asr, extraction/reply, tts, send) because the client
+connects with ?timings=1; the client adds what it observes itself:
+
+    endpoint      end of speech -> speech_end message (VAD silence window)
+    transcript    end of speech -> transcript message
+    first_audio   end of speech -> first reply audio (the end-to-end latency)
+    reply_done    end of speech -> last reply audio
+
+--with-stubs also serves the bench.stubs stand-ins in this process; the
+server still has to be started pointing at them.
+"""
+import argparse
+import asyncio
+import json
+import time
+import wave
+import numpy as np
+import aiohttp
+from audio_utils import StreamingResampler
+from bench.stubs import add_stub_arguments, start_stubs, stubs_from_args
+
+SAMPLE_RATE = 48000
+FRAME_SAMPLES = 2048  # what the browser's ScriptProcessor sends
+TURN_TIMEOUT = 30.0
+CLIENT_STAGES = ("endpoint", "transcript", "first_audio", "reply_done")
+
+
+def load_utterance(path):
+    """Returns the utterance as 48 kHz mono int16 bytes."""
+    if not path.endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read()
+
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit PCM")
+        rate, channels = w.getframerate(), w.getnchannels()
+        samples = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)[::channels]
+    if rate != SAMPLE_RATE:
+        resampled = StreamingResampler(rate, SAMPLE_RATE).process(samples.tobytes())
+        samples = np.clip(resampled * 32768.0, -32768, 32767).astype(np.int16)
+    return samples.tobytes()
+
+
+def frames(pcm):
+    frame_bytes = FRAME_SAMPLES * 2
+    for offset in range(0, len(pcm), frame_bytes):
+        yield pcm[offset:offset + frame_bytes]
+
+
+async def send_realtime(ws, pcm):
+    """Sends pcm paced like a live microphone."""
+    start = time.perf_counter()
+    sent = 0
+    for frame in frames(pcm):
+        await ws.send_bytes(frame)
+        sent += len(frame) // 2
+        delay = start + sent / SAMPLE_RATE - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def send_silence(ws):
+    """Keeps the microphone open after speaking, as the browser does."""
+    await send_realtime(ws, bytes(FRAME_SAMPLES * 2))
+    while True:
+        await send_realtime(ws, bytes(FRAME_SAMPLES * 2 * 24))
+
+
+async def receive_reply(ws, spoke_at=None):
+    """
+    Reads messages until the assistant's reply has been fully received and
+    returns the client-side timings (seconds after spoke_at) plus the
+    server's turn_timings, if any.
+    """
+    timings = {}
+    result = {"timings": timings, "server": {}}
+
+    def mark(stage):
+        if spoke_at is not None and stage not in timings:
+            timings[stage] = time.perf_counter() - spoke_at
+
+    pending_audio = False
+    done = False
+    while True:
+        try:
+            # Once the audio is in, give the server a moment to send its turn_timings
+            message = await ws.receive(timeout=1.0 if done else None)
+        except asyncio.TimeoutError:
+            return result
+        if message.type == aiohttp.WSMsgType.BINARY:
+            mark("first_audio")
+            if pending_audio:
+                done = True
+            continue
+        if message.type != aiohttp.WSMsgType.TEXT:
+            raise RuntimeError(f"connection closed ({message.type.name})")
+
+        data = json.loads(message.data)
+        kind = data.get("type")
+        if kind == "speech_end":
+            mark("endpoint")
+        elif kind == "transcript":
+            mark("transcript")
+            result["transcript"] = data.get("text")
+        elif kind == "assistant_reply":
+            result["reply"] = data.get("text")
+            if data.get("audio_bytes"):
+                pending_audio = True
+            elif not data.get("streaming"):
+                if data.get("audio_b64"):
+                    mark("first_audio")
+                done = True
+        elif kind == "audio_stream":
+            mark("first_audio")
+        elif kind == "audio_stream_end":
+            done = True
+        elif kind == "turn_timings":
+            result["server"] = data["timings_ms"]
+        elif kind in ("error", "unavailable", "busy"):
+            raise RuntimeError(data.get("message") or kind)
+
+        if done:
+            mark("reply_done")
+            if result["server"] or spoke_at is None:
+                return result
+
+
+async def run_caller(caller_id, url, utterances, turns, results, stagger=0.0):
+    """One simulated caller: waits for the greeting, then speaks `turns` utterances."""
+    await asyncio.sleep(stagger * caller_id)
+    async with aiohttp.ClientSession() as http:
+        try:
+            ws = await http.ws_connect(url, max_msg_size=0)
+            await asyncio.wait_for(receive_reply(ws), TURN_TIMEOUT)  # the greeting
+        except (asyncio.TimeoutError, RuntimeError, aiohttp.ClientError) as e:
+            results.append({"caller": caller_id, "turn": None, "error": str(e) or type(e).__name__})
+            return
+
+        async with ws:
+            for turn in range(turns):
+                pcm = utterances[(caller_id + turn) % len(utterances)]
+                record = {"caller": caller_id, "turn": turn}
+                await send_realtime(ws, pcm)
+                spoke_at = time.perf_counter()
+                silence = asyncio.create_task(send_silence(ws))
+                try:
+                    reply = await asyncio.wait_for(receive_reply(ws, spoke_at), TURN_TIMEOUT)
+                    record.update(reply)
+                except (asyncio.TimeoutError, RuntimeError, aiohttp.ClientError) as e:
+                    # A turn that timed out may still answer late; later turns on this connection would be skewed
+                    record["error"] = str(e) or type(e).__name__
+                    results.append(record)
+                    return
+                finally:
+                    silence.cancel()
+                results.append(record)
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": int(len(values)), "mean": float(values.mean()), "p50": float(p50),
+            "p95": float(p95), "p99": float(p99), "max": float(values.max())}
+
+
+def summarize(results, wall_seconds):
+    ok = [r for r in results if "error" not in r]
+    summary = {
+        "turns": len(ok),
+        "errors": len(results) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "turns_per_second": round(len(ok) / wall_seconds, 3) if wall_seconds else None,
+        "client_ms": {},
+        "server_ms": {},
+    }
+    for stage in CLIENT_STAGES:
+        values = [r["timings"][stage] * 1000 for r in ok if stage in r["timings"]]
+        if values:
+            summary["client_ms"][stage] = percentiles(values)
+    server_stages = sorted({stage for r in ok for stage in r["server"]})
+    for stage in server_stages:
+        summary["server_ms"][stage] = percentiles([r["server"][stage] for r in ok if stage in r["server"]])
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{summary['turns']} turns, {summary['errors']} errors in {summary['wall_seconds']:.1f}s "
+          f"({summary['turns_per_second']} turns/s)")
+    for title, key in (("client (after end of speech)", "client_ms"), ("server stages", "server_ms")):
+        if not summary[key]:
+            continue
+        print(f"\n{title:<30}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  ms")
+        for stage, stats in summary[key].items():
+            print(f"  {stage:<28}{stats['p50']:>9.0f}{stats['p95']:>9.0f}{stats['p99']:>9.0f}{stats['max']:>9.0f}")
+
+
+async def run(args):
+    utterances = [load_utterance(path) for path in args.audio]
+    query = "protocol=binary&timings=1" + ("" if args.buffered_tts else "&tts=stream")
+    url = f"{args.url}{'&' if '?' in args.url else '?'}{query}"
+
+    runners = []
+    if args.with_stubs:
+        runners = await start_stubs(*stubs_from_args(args), args.host, args.llm_port, args.tts_port)
+    results = []
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_caller(i, url, utterances, args.turns, results, args.stagger) for i in range(args.callers)
+        ))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+    summary = summarize(results, wall_seconds)
+    print_summary(summary)
+    for record in results:
+        if "error" in record:
+            print(f"  caller {record['caller']} turn {record['turn']}: {record['error']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "turns": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the /ws/audio voice loop.")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/audio")
+    parser.add_argument("--audio", nargs="+", required=True, help=".wav or 48 kHz int16 .pcm utterances")
+    parser.add_argument("--callers", type=int, default=1, help="concurrent simulated callers")
+    parser.add_argument("--turns", type=int, default=3, help="utterances per caller")
+    parser.add_argument("--stagger", type=float, default=0.1, help="seconds between caller connects")
+    parser.add_argument("--buffered-tts", action="store_true", help="ask for whole-reply audio instead of streaming")
+    parser.add_argument("--json", help="write the summary and every turn to this file")
+    parser.add_argument("--with-stubs", action="store_true", help="also serve the OpenAI/ElevenLabs stand-ins")
+    add_stub_arguments(parser)
+    asyncio.run(run(parser.parse_args()))
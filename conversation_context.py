@@ -0,0 +1,91 @@
+# conversation_context.py
+import asyncio
+import json
+import os
+from llm_client import llm
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))  # prompt tokens per reply request
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "6"))  # history kept verbatim
+CONTEXT_COMPACT_AFTER = int(os.getenv("CONTEXT_COMPACT_AFTER", "6"))  # older messages folded per summary
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+
+SUMMARY_PROMPT = (
+    "You keep the running memory of a conversation between an assistant filling out a merchant application "
+    "and the user. Form field values are tracked separately, so do not list them. Update the summary with "
+    "the new messages in at most three short sentences: corrections, preferences, doubts and open questions."
+)
+
+
+def estimate_tokens(text):
+    # About four characters per token for English; avoids shipping a tokenizer
+    return len(text) // 4 + 4
+
+
+def form_state(form_data):
+    """The form as compact JSON: what is filled and what is still missing."""
+    filled = {field: value for field, value in form_data.items() if value is not None}
+    missing = [field for field, value in form_data.items() if value is None]
+    return json.dumps({"filled": filled, "missing": missing}, separators=(",", ":"), ensure_ascii=False)
+
+
+def build_messages(session, system_prompt, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Builds the chat messages for a reply request. The system prompt comes
+    first and never changes, so providers can cache that prefix; after it
+    come the rolling summary, the most recent messages that fit in `budget`
+    tokens (always at least the last one) and the current form state.
+    """
+    state = {"role": "system", "content": "Form state: " + form_state(session.form_data)}
+    head = [{"role": "system", "content": system_prompt}]
+    if session.context_summary:
+        head.append({"role": "system", "content": "Conversation so far: " + session.context_summary})
+
+    used = sum(estimate_tokens(m["content"]) for m in head + [state])
+    recent = []
+    for msg in reversed(session.conversation_history[-CONTEXT_RECENT_MESSAGES:]):
+        cost = estimate_tokens(msg["text"])
+        if recent and used + cost > budget:
+            break
+        recent.append({"role": msg["role"], "content": msg["text"]})
+        used += cost
+    return head + recent[::-1] + [state]
+
+
+def maybe_compact(session):
+    """
+    Folds history older than the recent window into the rolling summary in
+    the background, once enough of it has built up. The turn never waits
+    for it; until it finishes the old messages simply stay in history.
+    """
+    if session.compaction_task is not None and not session.compaction_task.done():
+        return
+    count = len(session.conversation_history) - CONTEXT_RECENT_MESSAGES
+    if count < CONTEXT_COMPACT_AFTER:
+        return
+    session.compaction_task = asyncio.create_task(_compact(session, count))
+
+
+async def _compact(session, count):
+    history = session.conversation_history
+    old = history[:count]
+    transcript = "\n".join(f"{msg['role']}: {msg['text']}" for msg in old)
+    try:
+        response = await llm.chat(
+            model=CONTEXT_SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Summary so far: {session.context_summary or '(none)'}\n\n"
+                                            f"New messages:\n{transcript}"}
+            ],
+            temperature=0.2,
+            max_tokens=150,
+            call="summary"
+        )
+        summary = response['choices'][0]['message']['content'].strip()
+    except Exception as e:
+        print("⚠️ Conversation summary error:", e)
+        return
+    # A reset while summarizing replaces the history; don't fold stale messages into the new one
+    if session.conversation_history is history and history[:count] == old:
+        session.context_summary = summary
+        del history[:count]
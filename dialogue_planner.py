@@ -0,0 +1,90 @@
+# dialogue_planner.py
+import os
+import re
+
+DIALOGUE_PLANNER = os.getenv("DIALOGUE_PLANNER", "1") == "1"  # template the next question when we can
+
+# Asked in this order; each question names its field clearly enough for field_extractors to expect it
+FIELD_QUESTIONS = {
+    "SiteCompanyName1": "What's the DBA name your business operates under?",
+    "SiteAddress": "What's the street address of your business location?",
+    "SiteCity": "Which city is that in?",
+    "SiteState": "And which state?",
+    "SiteZip": "What's the zip code there?",
+    "SiteVoice": "What's the business phone number?",
+    "SiteFax": "Do you have a fax number for the business? If not, just say none.",
+    "CorporateCompanyName1": "What's the legal corporate name of the business?",
+    "CorporateAddress": "What's the corporate mailing address?",
+    "CorporateCity": "Which city is the corporate address in?",
+    "CorporateState": "Which state is the corporate address in?",
+    "CorporateZip": "And the corporate zip code?",
+    "CorporateName": "Who is the main contact person for the business?",
+    "SiteEmail": "What's the business email address?",
+    "CorporateVoice": "What's the best phone number for the corporate office?",
+    "CorporateFax": "And the corporate fax number, if there is one?",
+    "BusinessWebsite": "Does the business have a website? If so, what's the address?",
+    "CorporateEmail": "What's the corporate email address?",
+    "CustomerSvcEmail": "What email should customers use for customer service?",
+    "AppRetrievalMail": "Should chargeback retrieval requests be sent to you by mail?",
+    "AppRetrievalFax": "Should retrieval requests be sent by fax?",
+    "AppRetrievalFaxNumber": "Which fax number should retrieval requests go to?",
+    "MCC-Desc": "Last one: briefly, what does your business sell or do?",
+}
+
+# Fields asked together when all of them are still missing
+FIELD_GROUPS = {
+    ("AppRetrievalMail", "AppRetrievalFax"):
+        "Should chargeback retrieval requests be sent to you by mail, by fax, or both?",
+}
+
+ACKNOWLEDGEMENTS = ["Got it.", "Thanks.", "Great."]
+
+# Every sentence the planner can say, for TTS pre-synthesis
+PHRASES = ACKNOWLEDGEMENTS + list(FIELD_QUESTIONS.values()) + list(FIELD_GROUPS.values())
+
+# Answers that change, doubt or question something need the model
+CORRECTION_RE = re.compile(
+    r"\b(no|nope|not|actually|wait|change|wrong|mistake|correct(ion)?|instead|sorry|update|fix)\b|n't\b"
+)
+HEDGE_RE = re.compile(r"\b(maybe|perhaps|not sure|i guess|don'?t know|probably|either)\b")
+QUESTION_RE = re.compile(r"\?|^\s*(what|why|how|who|where|when|which|can|could|should|do|does|is|are|will)\b")
+
+
+def next_fields(form_data):
+    """The field (or group of fields) to ask about next, or () when the form is complete."""
+    missing = [field for field in FIELD_QUESTIONS if form_data.get(field) is None]
+    if not missing:
+        return ()
+    for group in FIELD_GROUPS:
+        if group[0] == missing[0] and all(field in missing for field in group):
+            return group
+    return (missing[0],)
+
+
+def question_for(fields):
+    return FIELD_GROUPS.get(fields) or FIELD_QUESTIONS[fields[0]]
+
+
+def can_plan(form_data, parsed, user_text):
+    """
+    True when the user's reply just answered with new values: something was
+    extracted, nothing already filled gets overwritten, and the reply is not
+    a correction, a hedge or a question of its own. Call before applying
+    `parsed` to the form.
+    """
+    if not parsed or any(form_data.get(field) is not None for field in parsed):
+        return False
+    text = user_text.lower()
+    return not (CORRECTION_RE.search(text) or HEDGE_RE.search(text) or QUESTION_RE.search(text))
+
+
+def plan_reply(form_data, turn):
+    """
+    The templated reply as a list of sentences (an acknowledgement and the
+    next question), or None when nothing is left to ask. `turn` varies the
+    acknowledgement.
+    """
+    fields = next_fields(form_data)
+    if not fields:
+        return None
+    return [ACKNOWLEDGEMENTS[turn % len(ACKNOWLEDGEMENTS)], question_for(fields)]
@@ -0,0 +1,236 @@
+# field_extractors.py
+import os
+import re
+
+FAST_EXTRACT = os.getenv("FAST_EXTRACT", "1") == "1"  # try local extraction before asking the LLM
+
+# Form fields by answer format, in the order they are usually asked for
+FIELD_TYPES = {
+    "zip": ["SiteZip", "CorporateZip"],
+    "phone": ["SiteVoice", "CorporateVoice"],
+    "fax": ["SiteFax", "CorporateFax", "AppRetrievalFaxNumber"],
+    "email": ["SiteEmail", "CorporateEmail", "CustomerSvcEmail"],
+    "website": ["BusinessWebsite"],
+    "state": ["SiteState", "CorporateState"],
+}
+
+# What the assistant's question has to mention for us to expect each type
+QUESTION_PATTERNS = {
+    "zip": re.compile(r"\b(zip|postal)\b"),
+    "fax": re.compile(r"\bfax\b"),
+    "phone": re.compile(r"\b(phone|telephone|voice)\b"),
+    "email": re.compile(r"\be-?mail\b"),
+    "website": re.compile(r"\b(website|web site|web address|url)\b"),
+    "state": re.compile(r"\bstate\b"),
+}
+
+# Words that narrow the question down to one of a type's fields
+FIELD_HINTS = {
+    "CorporateZip": re.compile(r"\b(corporate|legal|headquarters?|billing|mailing)\b"),
+    "CorporateVoice": re.compile(r"\b(corporate|legal|headquarters?)\b"),
+    "CorporateFax": re.compile(r"\b(corporate|legal|headquarters?)\b"),
+    "AppRetrievalFaxNumber": re.compile(r"\b(retrieval|chargeback)\b"),
+    "CorporateEmail": re.compile(r"\b(corporate|legal|headquarters?)\b"),
+    "CustomerSvcEmail": re.compile(r"\b(customer service|customer support|support)\b"),
+    "CorporateState": re.compile(r"\b(corporate|legal|headquarters?|billing|mailing)\b"),
+}
+
+# Words an answer may contain around the value without making it ambiguous
+FILLER_WORDS = {
+    "a", "an", "and", "area", "address", "business", "code", "company", "corporate", "email", "e", "mail",
+    "fax", "i", "in", "is", "it", "it's", "its", "located", "mailing", "my", "number", "of", "ok", "okay",
+    "our", "phone", "please", "postal", "site", "so", "state", "sure", "that's", "the", "think", "um", "uh",
+    "we", "we're", "web", "website", "yeah", "yes", "zip", "zipcode", "here", "that", "be", "would",
+    "office", "main", "store", "based", "out", "just", "sign", "address's", "thanks", "thank", "you",
+}
+
+DIGIT_WORDS = {
+    "zero": "0", "oh": "0", "o": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+REPEAT_WORDS = {"double": 2, "triple": 3}
+
+SPOKEN_SYMBOLS = [
+    (re.compile(r"\s*\bat sign\b\s*|\s+at\s+"), "@"),
+    (re.compile(r"\s*\bdot\b\s*"), "."),
+    (re.compile(r"\s*\bunderscore\b\s*"), "_"),
+    (re.compile(r"\s*\b(dash|hyphen)\b\s*"), "-"),
+]
+SPELLED_LETTERS = re.compile(r"\b([a-z0-9])\s+(?=[a-z0-9]\b)")
+# How Whisper writes spelled-out letters ("J-O-H-N"); the hyphens aren't part of the value
+SPELLED_HYPHENATED = re.compile(r"\b[a-z0-9](?:-[a-z0-9])+\b")
+
+EMAIL_RE = re.compile(r"[a-z0-9][a-z0-9._%+-]*@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}")
+WEBSITE_RE = re.compile(
+    r"(?:https?://)?(?:www\.)?[a-z0-9-]+(?:\.[a-z0-9-]+)*"
+    r"\.(?:com|net|org|biz|info|us|co|io|ai|app|shop|store|online|site|dev|edu|gov)\b(?:/[^\s]*)?"
+)
+
+US_STATES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA", "colorado": "CO",
+    "connecticut": "CT", "delaware": "DE", "district of columbia": "DC", "florida": "FL", "georgia": "GA",
+    "hawaii": "HI", "idaho": "ID", "illinois": "IL", "indiana": "IN", "iowa": "IA", "kansas": "KS",
+    "kentucky": "KY", "louisiana": "LA", "maine": "ME", "maryland": "MD", "massachusetts": "MA",
+    "michigan": "MI", "minnesota": "MN", "mississippi": "MS", "missouri": "MO", "montana": "MT",
+    "nebraska": "NE", "nevada": "NV", "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM",
+    "new york": "NY", "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK",
+    "oregon": "OR", "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA", "washington": "WA",
+    "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_NAME_RE = re.compile(r"\b(" + "|".join(sorted(US_STATES, key=len, reverse=True)) + r")\b")
+# Abbreviations only count as Whisper writes them (upper case), since "in", "me", "or" are words too;
+# "OK" is left out because it usually is one
+STATE_CODE_RE = re.compile(r"\b(" + "|".join(sorted(set(US_STATES.values()) - {"OK"})) + r")\b")
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def _only_fillers(text):
+    return all(word in FILLER_WORDS for word in _words(text))
+
+
+def _digits(text):
+    """The digits spoken or written in `text`, or None if anything else but filler is said."""
+    digits = []
+    repeat = 1
+    for word in re.findall(r"[a-z']+|\d+", text.lower()):
+        if word.isdigit():
+            digits.append(word * repeat if repeat > 1 and len(word) == 1 else word)
+        elif word in REPEAT_WORDS:
+            repeat = REPEAT_WORDS[word]
+            continue
+        elif word in DIGIT_WORDS:
+            digits.append(DIGIT_WORDS[word] * repeat)
+        elif word not in FILLER_WORDS:
+            return None
+        repeat = 1
+    return "".join(digits)
+
+
+def parse_zip(text):
+    digits = _digits(text)
+    if digits and len(digits) == 5:
+        return digits
+    if digits and len(digits) == 9:
+        return f"{digits[:5]}-{digits[5:]}"
+    return None
+
+
+def parse_phone(text):
+    digits = _digits(text)
+    if digits and len(digits) == 11 and digits[0] == "1":
+        digits = digits[1:]
+    if digits and len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    return None
+
+
+def _spoken_to_written(text):
+    text = text.lower().strip().rstrip(".!?,")
+    text = SPELLED_HYPHENATED.sub(lambda match: match.group().replace("-", ""), text)
+    for pattern, symbol in SPOKEN_SYMBOLS:
+        text = pattern.sub(symbol, text)
+    return SPELLED_LETTERS.sub(r"\1", text)
+
+
+def _single_match(pattern, text):
+    matches = pattern.findall(text)
+    if len(matches) != 1 or not _only_fillers(pattern.sub(" ", text)):
+        return None
+    return matches[0]
+
+
+def parse_email(text):
+    return _single_match(EMAIL_RE, _spoken_to_written(text))
+
+
+def parse_website(text):
+    text = _spoken_to_written(text)
+    if "@" in text:
+        return None
+    return _single_match(WEBSITE_RE, text)
+
+
+def parse_state(text):
+    codes = {US_STATES[name] for name in STATE_NAME_RE.findall(text.lower())}
+    codes |= set(STATE_CODE_RE.findall(text))
+    rest = STATE_CODE_RE.sub(" ", text)
+    rest = STATE_NAME_RE.sub(" ", rest.lower())
+    if len(codes) != 1 or not _only_fillers(rest):
+        return None
+    return codes.pop()
+
+
+PARSERS = {
+    "zip": parse_zip,
+    "phone": parse_phone,
+    "fax": parse_phone,
+    "email": parse_email,
+    "website": parse_website,
+    "state": parse_state,
+}
+
+
+def expected_field(form_data, question):
+    """
+    The field the assistant's question asks for, if it asks about exactly
+    one kind of rigidly formatted answer and one of those fields is still
+    empty. Returns (field, type) or None.
+    """
+    question = question.lower()
+    types = [kind for kind, pattern in QUESTION_PATTERNS.items() if pattern.search(question)]
+    if len(types) != 1:
+        return None
+    kind = types[0]
+    missing = [field for field in FIELD_TYPES[kind] if field in form_data and form_data[field] is None]
+    hinted = [field for field in missing if field in FIELD_HINTS and FIELD_HINTS[field].search(question)]
+    if hinted:
+        return hinted[0], kind
+    unhinted = [field for field in missing if field not in FIELD_HINTS]
+    if unhinted:
+        return unhinted[0], kind
+    return (missing[0], kind) if len(missing) == 1 else None
+
+
+def extract_local(form_data, question, answer):
+    """
+    Fills the expected field from the answer without a model call when the
+    answer is just that value, spoken or written. Returns {field: value},
+    or None to fall back to the LLM.
+    """
+    expected = expected_field(form_data, question)
+    if expected is None:
+        return None
+    field, kind = expected
+    value = PARSERS[kind](answer)
+    return {field: value} if value else None
+
+
+# Answers and what extract_local should make of them; `python field_extractors.py` checks them
+EXAMPLES = [
+    ("What's the ZIP code?", "nine four one oh five", {"SiteZip": "94105"}),
+    ("What's the business phone number?", "double five five, one two three, four five six seven",
+     {"SiteVoice": "555-123-4567"}),
+    ("What's the business email address?", "john at example dot com", {"SiteEmail": "john@example.com"}),
+    ("What's the business email address?", "J-O-H-N at example.com", {"SiteEmail": "john@example.com"}),
+    ("What's the business email address?", "j o h n dash s at example dot com", {"SiteEmail": "john-s@example.com"}),
+    ("What's the business email address?", "it's john at example dot com and jane at example dot com", None),
+    ("What's your website?", "www dot A-C-M-E dot com", {"BusinessWebsite": "www.acme.com"}),
+    ("Which state is the business in?", "We're in New York", {"SiteState": "NY"}),
+    ("Which state is the business in?", "OK", None),
+]
+
+
+if __name__ == "__main__":
+    empty = {field: None for fields in FIELD_TYPES.values() for field in fields}
+    failures = 0
+    for question, answer, expected in EXAMPLES:
+        got = extract_local(empty, question, answer)
+        if got != expected:
+            failures += 1
+            print(f"❌ {answer!r}: expected {expected}, got {got}")
+    print(f"{len(EXAMPLES) - failures}/{len(EXAMPLES)} examples extracted as expected")
+    raise SystemExit(1 if failures else 0)
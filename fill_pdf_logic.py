@@ -1,16 +1,19 @@
+import os
+import re
 import sys
 import json
 import io
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
 
 
-def extract_form_fields(pdf_path):
-    """
-    Extracts form field positions and metadata using PyMuPDF
-    """
-    fields = {}
-    doc = fitz.open(pdf_path)
+_template_cache = {}  # pdf_path -> ((mtime_ns, size), template_bytes, fields)
+
 
+def _index_fields(doc):
+    fields = {}
     for page_num, page in enumerate(doc):
         widgets = page.widgets()
         for widget in widgets:
@@ -23,29 +26,47 @@ def extract_form_fields(pdf_path):
                     'rect': [rect.x0, rect.y0, rect.x1, rect.y1],
                     'type': field_type
                 }
+    return fields
+
 
+def load_template(pdf_path):
+    """
+    Returns the template's bytes and its field index. Both are parsed once
+    and cached until the file's mtime or size changes.
+    """
+    stat = os.stat(pdf_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _template_cache.get(pdf_path)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    with open(pdf_path, 'rb') as file:
+        template_bytes = file.read()
+    doc = fitz.open(stream=template_bytes, filetype="pdf")
+    fields = _index_fields(doc)
     doc.close()
-    return fields
+    _template_cache[pdf_path] = (version, template_bytes, fields)
+    return template_bytes, fields
 
 
-def fill_pdf(input_pdf_path, output_pdf_path, data):
+def extract_form_fields(pdf_path):
     """
-    Overlays extracted field values into corresponding positions on a PDF using text rendering.
+    Extracts form field positions and metadata using PyMuPDF
     """
-    # Clean up null values
-    for key in list(data.keys()):
-        if data[key] == "null" or data[key] is None:
-            data[key] = ""
+    return load_template(pdf_path)[1]
 
-    print("Extracting field positions...")
-    fields = extract_form_fields(input_pdf_path)
 
-    print(f"Opening PDF: {input_pdf_path}")
-    doc = fitz.open(input_pdf_path)
+def render_pdf(input_pdf_path, data):
+    """
+    Overlays field values onto the template in memory and returns the
+    resulting PDF as bytes. `data` is not modified.
+    """
+    template_bytes, fields = load_template(input_pdf_path)
+    doc = fitz.open(stream=template_bytes, filetype="pdf")
 
     for field_name, field_info in fields.items():
-        if field_name in data and data[field_name]:
-            value = data[field_name]
+        value = data.get(field_name)
+        if value and value != "null":
             page_num = field_info['page']
             x0, y0, x1, y1 = field_info['rect']
             page = doc[page_num]
@@ -54,12 +75,20 @@ def fill_pdf(input_pdf_path, output_pdf_path, data):
             x_pos = x0 + 2                     # Small left margin
             y_pos = y0 + (y1 - y0) * 0.75      # Slightly below center
 
-            print(f"Field: {field_name}, Value: {value}")
             page.insert_text((x_pos, y_pos), str(value), fontsize=font_size, fontname="helv")
 
-    print(f"Saving to: {output_pdf_path}")
-    doc.save(output_pdf_path, incremental=False, deflate=True)
+    pdf_bytes = doc.tobytes(deflate=True)
     doc.close()
+    return pdf_bytes
+
+
+def fill_pdf(input_pdf_path, output_pdf_path, data):
+    """
+    Overlays extracted field values into corresponding positions on a PDF using text rendering.
+    """
+    pdf_bytes = render_pdf(input_pdf_path, data)
+    with open(output_pdf_path, 'wb') as file:
+        file.write(pdf_bytes)
     print(f"PDF successfully filled and saved to {output_pdf_path}")
 
 
@@ -72,8 +101,152 @@ def load_json_data(json_file_path):
     return field_values
 
 
+RECORD_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,127}")
+
+
+def _as_record(value):
+    if not isinstance(value, dict):
+        raise ValueError(f"expected a JSON object, got {type(value).__name__}")
+    return value
+
+
+def _record_name(raw):
+    """
+    The output file name (without .pdf) for a record's _id: its basename,
+    restricted to letters, digits, '.', '_' and '-' so it can't leave the
+    output directory or the archive root.
+    """
+    name = os.path.basename(str(raw).replace("\\", "/"))
+    if not RECORD_NAME_RE.fullmatch(name):
+        raise ValueError(f"invalid _id {raw!r} (use letters, digits, '.', '_' and '-')")
+    return name
+
+
+def _iter_raw_records(source):
+    if os.path.isdir(source):
+        for file_name in sorted(os.listdir(source)):
+            if not file_name.endswith(".json"):
+                continue
+            name = os.path.splitext(file_name)[0]
+            try:
+                yield name, _as_record(load_json_data(os.path.join(source, file_name)))
+            except Exception as e:
+                yield name, e
+        return
+
+    with open(source, 'r') as file:
+        for line_num, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            label = f"record_{line_num:06d}"
+            try:
+                record = _as_record(json.loads(line))
+                raw_id = record.pop("_id", None)
+                name = _record_name(raw_id) if raw_id not in (None, "") else label
+            except Exception as e:
+                yield label, e
+                continue
+            yield name, record
+
+
+def iter_records(source):
+    """
+    Yields (name, record) pairs from a JSONL file (one object per line) or a
+    directory of .json files. Entries that can't be read, aren't objects,
+    have an unusable _id or reuse another record's name yield their error
+    instead of a record so they show up in the batch report.
+    """
+    seen = set()
+    for name, record in _iter_raw_records(source):
+        if not isinstance(record, Exception):
+            try:
+                name = _record_name(name)
+            except ValueError as e:
+                record = e
+            else:
+                if name.lower() in seen:  # case-insensitive filesystems would overwrite too
+                    record = ValueError(f"duplicate name {name!r}; not overwriting the earlier record")
+                seen.add(name.lower())
+        yield name, record
+
+
+_worker_template = None
+
+
+def _init_batch_worker(input_pdf_path):
+    # Parse the template and field index once per worker process
+    global _worker_template
+    _worker_template = input_pdf_path
+    load_template(input_pdf_path)
+
+
+def _fill_record(job):
+    name, record, output_dir = job
+    if isinstance(record, Exception):
+        return name, None, f"invalid record: {record}"
+    try:
+        pdf_bytes = render_pdf(_worker_template, record)
+        if output_dir:
+            with open(os.path.join(output_dir, f"{name}.pdf"), 'wb') as file:
+                file.write(pdf_bytes)
+            return name, None, None
+        return name, pdf_bytes, None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def fill_pdf_batch(input_pdf_path, records_source, output, workers=None, chunksize=4):
+    """
+    Fills every record from `records_source` into the template using a
+    process pool. `output` is a directory, or a path ending in .zip to stream
+    the PDFs into one archive. Returns (succeeded, failed) counts.
+    """
+    to_zip = output.endswith(".zip")
+    output_dir = None if to_zip else output
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = ((name, record, output_dir) for name, record in iter_records(records_source))
+
+    succeeded = failed = 0
+    start = time.time()
+    archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) if to_zip else None  # PDFs are already deflated
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(input_pdf_path,)) as pool:
+            for name, pdf_bytes, error in pool.map(_fill_record, jobs, chunksize=chunksize):
+                if error:
+                    failed += 1
+                    print(f"❌ {name}: {error}", file=sys.stderr)
+                    continue
+                if archive:
+                    archive.writestr(f"{name}.pdf", pdf_bytes)
+                succeeded += 1
+    finally:
+        if archive:
+            archive.close()
+
+    elapsed = time.time() - start
+    total = succeeded + failed
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Filled {succeeded}/{total} records into {output} in {elapsed:.1f}s ({rate:.1f} records/s), {failed} failed")
+    return succeeded, failed
+
+
 if __name__ == "__main__":
-    if len(sys.argv) == 4:
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        import argparse
+        parser = argparse.ArgumentParser(prog="fill_pdf_logic.py batch",
+                                         description="Fill many records into the PDF template in parallel.")
+        parser.add_argument("input_pdf_path")
+        parser.add_argument("records", help="JSONL file (one record per line, optional _id) or directory of .json files")
+        parser.add_argument("output", help="output directory, or a .zip file")
+        parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+        parser.add_argument("--chunksize", type=int, default=4, help="records handed to a worker at a time")
+        args = parser.parse_args(sys.argv[2:])
+
+        _, failed_count = fill_pdf_batch(args.input_pdf_path, args.records, args.output, args.workers, args.chunksize)
+        sys.exit(1 if failed_count else 0)
+    elif len(sys.argv) == 4:
         input_pdf_path = sys.argv[1]
         json_file_path = sys.argv[2]
         output_pdf_path = sys.argv[3]
@@ -82,6 +255,7 @@ if __name__ == "__main__":
         fill_pdf(input_pdf_path, output_pdf_path, field_values)
     else:
         print("Usage: python pdf_text_overlay.py <input_pdf_path> <json_file_path> <output_pdf_path>")
+        print("       python fill_pdf_logic.py batch <input_pdf_path> <records.jsonl|records_dir> <output_dir|output.zip> [--workers N]")
 
         # Uncomment for quick testing:
         # input_pdf_path = "form.pdf"
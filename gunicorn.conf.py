@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Multi-worker deployment: gunicorn -c gunicorn.conf.py main:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+shared_sessions = bool(os.getenv("SESSION_STORE_URL"))
+workers = int(os.getenv("WEB_CONCURRENCY", "2" if shared_sessions else "1"))
+if workers > 1 and not shared_sessions:
+    # In-process sessions are per worker: /form-data, /confirm and /download would 404 on the others
+    print(f"⚠️ WEB_CONCURRENCY={workers} needs a shared SESSION_STORE_URL; starting 1 worker.")
+    workers = 1
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+
+def on_starting(server):
+    # Load the model weights once in the master; forked workers share them
+    # copy-on-write and only run their own warm-up at startup.
+    from models import registry
+    registry.load()
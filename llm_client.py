@@ -0,0 +1,205 @@
+# llm_client.py
+import json
+import os
+import re
+import time
+import aiohttp
+from metrics import LLM_ERRORS, LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, LLM_TOKENS
+
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")  # point at a local stand-in for offline runs
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "100"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+# A sentence ends at . ! ? (plus closing quotes/brackets) followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r"[.!?][\"')\]]*\s+|\n+")
+JSON_STRING_RUN = re.compile(r'[^"\\]+')
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMClient:
+    """
+    Async chat-completions client on one shared aiohttp session, so every
+    caller reuses the same keep-alive connection pool. Calls never block the
+    event loop, and cancelling the awaiting task aborts the HTTP request.
+    """
+
+    def __init__(self, base_url=OPENAI_API_BASE, api_key=None, pool_size=LLM_POOL_SIZE,
+                 keepalive=LLM_KEEPALIVE_SECONDS, timeout=LLM_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self._api_key = api_key
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _headers(self):
+        api_key = self._api_key or os.getenv("OPENAI_API_KEY", "")
+        return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    async def _post(self, payload):
+        response = await self._get_session().post(
+            f"{self.base_url}/chat/completions", json=payload, headers=self._headers()
+        )
+        if response.status != 200:
+            body = await response.text()
+            response.release()
+            raise LLMError(f"LLM request failed ({response.status}): {body[:200]}")
+        return response
+
+    async def chat(self, messages, model="gpt-4", call="chat", **params):
+        """Returns the chat-completions response as a dict. `call` labels the request in the metrics."""
+        start = time.perf_counter()
+        try:
+            response = await self._post({"model": model, "messages": messages, **params})
+            async with response:
+                body = await response.json()
+        except Exception:
+            LLM_ERRORS.labels(call).inc()
+            raise
+        LLM_SECONDS.labels(call).observe(time.perf_counter() - start)
+        record_usage(call, body.get("usage"))
+        return body
+
+    async def stream_chat(self, messages, model="gpt-4", call="chat", **params):
+        """Yields content deltas (for a forced function call, argument deltas) as the model produces them."""
+        start = time.perf_counter()
+        usage = None
+        chunks = 0
+        try:
+            response = await self._post({
+                "model": model, "messages": messages, "stream": True,
+                "stream_options": {"include_usage": True}, **params
+            })
+            async with response:
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    usage = event.get("usage") or usage
+                    choices = event.get("choices") or [{}]
+                    delta = choices[0].get("delta") or {}
+                    tool_calls = delta.get("tool_calls")
+                    delta = tool_calls[0].get("function", {}).get("arguments") if tool_calls else delta.get("content")
+                    if delta:
+                        if not chunks:
+                            LLM_FIRST_TOKEN_SECONDS.labels(call).observe(time.perf_counter() - start)
+                        chunks += 1
+                        yield delta
+        except Exception:
+            LLM_ERRORS.labels(call).inc()
+            raise
+        LLM_SECONDS.labels(call).observe(time.perf_counter() - start)
+        # Servers that ignore include_usage still send about one token per delta
+        record_usage(call, usage or {"completion_tokens": chunks})
+
+
+def record_usage(call, usage):
+    for kind in ("prompt", "completion"):
+        tokens = (usage or {}).get(kind + "_tokens")
+        if tokens:
+            LLM_TOKENS.labels(call, kind).inc(tokens)
+
+
+class StreamedArguments:
+    """
+    Follows the JSON arguments of a streamed function call. `feed` takes the
+    next argument delta and returns the newly arrived text of the top-level
+    string `stream_key`, decoded; `value` returns another top-level value
+    once its JSON is complete, and None until then.
+    """
+
+    def __init__(self, stream_key):
+        self.text = ""
+        self._key_re = re.compile(r'"%s"\s*:\s*"' % re.escape(stream_key))
+        self._pos = None  # where the undecoded rest of the streamed string starts
+        self._closed = False
+
+    def feed(self, delta):
+        self.text += delta
+        if self._pos is None:
+            match = self._key_re.search(self.text)
+            if not match:
+                return ""
+            self._pos = match.end()
+        decoded = []
+        text, pos = self.text, self._pos
+        while pos < len(text) and not self._closed:
+            run = JSON_STRING_RUN.match(text, pos)
+            if run:
+                decoded.append(run.group())
+                pos = run.end()
+            elif text[pos] == '"':
+                self._closed = True
+            else:
+                # An escape; \uD83D-style surrogates come in pairs
+                if text[pos + 1:pos + 2] == "u":
+                    if pos + 4 > len(text):
+                        break
+                    length = 12 if text[pos + 2:pos + 4].lower() in ("d8", "d9", "da", "db") else 6
+                else:
+                    length = 2
+                if pos + length > len(text):
+                    break  # the rest of the escape is in the next delta
+                decoded.append(json.loads('"' + text[pos:pos + length] + '"'))
+                pos += length
+        self._pos = pos
+        return "".join(decoded)
+
+    def value(self, key):
+        match = re.search(r'"%s"\s*:\s*' % re.escape(key), self.text)
+        if match:
+            try:
+                return json.JSONDecoder().raw_decode(self.text, match.end())[0]
+            except ValueError:
+                pass
+        return None
+
+
+async def iter_sentences(deltas, min_chars=20):
+    """
+    Regroups a stream of text deltas into sentences so each one can go to
+    TTS while the rest is still generating. Boundaries before min_chars are
+    skipped to avoid speaking fragments like "Great." on their own.
+    """
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        while True:
+            cut = None
+            for match in SENTENCE_BOUNDARY.finditer(buffer):
+                if match.end() >= min_chars:
+                    cut = match.end()
+                    break
+            if cut is None:
+                break
+            sentence, buffer = buffer[:cut].strip(), buffer[cut:]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+
+llm = LLMClient()
@@ -1,27 +1,25 @@
-import os
+import asyncio
 import base64
 import tempfile
 import traceback
 from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from fill_pdf_logic import fill_pdf
 from realtime_assistant import (
-    process_transcribed_text,
-    form_data,
-    conversation_history,
     get_initial_assistant_message,
-    end_triggered,
     reset_assistant_state
 )
-from ws_audio import router as ws_audio_router
-import openai
+from llm_client import llm
+from metrics import metrics, recent_traces
+from models import registry
+from pdf_jobs import pdf_jobs
+from session_manager import sessions
+from ws_audio import router as ws_audio_router, asr_worker, prewarm_tts_cache
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 app = FastAPI()
 app.include_router(ws_audio_router)
@@ -38,39 +36,118 @@ app.add_middleware(
 # Static file mounting
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+
+@app.on_event("startup")
+async def on_startup():
+    registry.start()
+    sessions.start_sweeper()
+    asyncio.create_task(prewarm_tts_cache())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    sessions.stop_sweeper()
+    await asr_worker.stop()
+    await sessions.store.close()
+    await llm.close()
+    pdf_jobs.shutdown()
+
+
+def session_not_found():
+    return JSONResponse({"error": "unknown or expired session_id"}, status_code=404)
+
+
 @app.get("/")
 async def serve_index():
     return FileResponse("templates/index.html")
 
+@app.get("/healthz")
+async def healthz():
+    return JSONResponse({"status": "ok"})
+
+@app.get("/readyz")
+async def readyz():
+    body = {"status": registry.status}
+    if registry.error:
+        body["error"] = registry.error
+    return JSONResponse(body, status_code=200 if registry.ready else 503)
+
+@app.get("/asr-stats")
+async def asr_stats():
+    if registry.asr is None:
+        return JSONResponse({"status": registry.status}, status_code=503)
+    return JSONResponse(registry.asr.stats())
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces_endpoint(session_id: str = None):
+    # Empty unless METRICS_TRACE_TURNS=1
+    return JSONResponse(recent_traces(session_id))
+
 @app.get("/initial-message")
-async def initial_message():
-    assistant_text = get_initial_assistant_message()
+async def initial_message(session_id: str = None):
+    session = await sessions.get_or_create(session_id)
+    assistant_text = get_initial_assistant_message(session)
+    await sessions.save(session)
     return JSONResponse({
+        "session_id": session.session_id,
         "assistant_text": assistant_text,
         "assistant_audio_base64": None  # Deprecated in WS mode
     })
 
 @app.get("/form-data")
-async def get_form_data():
-    return JSONResponse(form_data)
+async def get_form_data(session_id: str):
+    session = await sessions.get(session_id)
+    if session is None:
+        return session_not_found()
+    return JSONResponse(session.form_data)
 
 @app.post("/confirm")
-async def confirm(request: Request):
+async def confirm(request: Request, session_id: str):
+    session = await sessions.get(session_id)
+    if session is None:
+        return session_not_found()
     try:
         body = await request.json()
         if body.get("confirmed"):
-            fill_pdf("form_template.pdf", "filled_form.pdf", form_data)
-            return JSONResponse({"status": "filled"})
+            # Usually the speculative render started when the form was completed is already done
+            job = pdf_jobs.confirm(session)
+            session.summary_confirmed = True
+            await sessions.save(session)
+            status = "filled" if job.status == "done" else "pending"
+            # Poll /download (202 until rendered), which any worker can answer
+            return JSONResponse({"status": status})
         return JSONResponse({"status": "not confirmed"}, status_code=400)
     except Exception as e:
         print("❌ Error in /confirm:", e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/download")
-async def download_pdf():
-    return FileResponse("filled_form.pdf", media_type="application/pdf", filename="MerchantForm.pdf")
+async def download_pdf(session_id: str):
+    session = await sessions.get(session_id)
+    if session is None:
+        return session_not_found()
+    job = session.pdf_job
+    if not session.summary_confirmed and (job is None or not job.confirmed):
+        return JSONResponse({"error": "form has not been confirmed yet"}, status_code=404)
+    # Re-renders if the form changed since (or was confirmed through another worker)
+    job = pdf_jobs.submit(session)
+    if job.status != "done":
+        return JSONResponse(job.to_dict(), status_code=202 if job.status in ("queued", "running") else 500)
+    return Response(
+        job.pdf_bytes,
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="MerchantForm.pdf"'}
+    )
 
 @app.post("/reset")
-async def reset():
-    reset_assistant_state()
+async def reset(session_id: str):
+    session = await sessions.get(session_id)
+    if session is None:
+        return session_not_found()
+    reset_assistant_state(session)
+    await sessions.save(session)
     return JSONResponse({"status": "reset successful"})
@@ -0,0 +1,263 @@
+# metrics.py
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_TRACE_TURNS = os.getenv("METRICS_TRACE_TURNS", "0") == "1"  # keep per-turn trace spans
+METRICS_TRACE_HISTORY = int(os.getenv("METRICS_TRACE_HISTORY", "200"))  # traced turns kept in memory
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A named family of samples, one per combination of label values. Updates
+    take a lock because the ASR and TTS worker threads record too.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Child(self, values)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value, *extra in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, *extra)} {_format_value(value)}")
+        return lines
+
+
+class _Child:
+    def __init__(self, metric, labels):
+        self._metric = metric
+        self._labels = labels
+
+    def __getattr__(self, name):
+        method = getattr(self._metric, "_" + name)
+        return lambda *args: method(self._labels, *args)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0):
+        self._inc((), amount)
+
+    def _inc(self, labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down. `function`, if given, is read at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value):
+        self._set((), value)
+
+    def inc(self, amount=1.0):
+        self._inc((), amount)
+
+    def dec(self, amount=1.0):
+        self._inc((), -amount)
+
+    def _set(self, labels, value):
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def _inc(self, labels, amount=1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self):
+        if self.function is not None:
+            return [(self.name, (), self.function())]
+        return super()._samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def time(self):
+        return _Child(self, ()).time()
+
+    def _observe(self, labels, value):
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[labels] = (counts, total + value)
+
+    @contextmanager
+    def _time(self, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._observe(labels, time.perf_counter() - start)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", labels, cumulative, [("le", _format_value(bound))]))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text format. Each worker
+    process keeps its own values, so scrape workers individually (or run
+    one) when several are forked.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# Audio front end
+RESAMPLE_SECONDS = metrics.histogram("voice_resample_seconds", "Time to resample one audio chunk.",
+                                     buckets=FAST_BUCKETS)
+VAD_SECONDS = metrics.histogram("voice_vad_seconds", "Time to run VAD over one audio chunk.", buckets=FAST_BUCKETS)
+
+# ASR
+ASR_QUEUE_WAIT_SECONDS = metrics.histogram("voice_asr_queue_wait_seconds",
+                                           "Time an ASR request waits before its batch starts.")
+ASR_SECONDS = metrics.histogram("voice_asr_seconds", "ASR inference time per batch.", ["backend"])
+ASR_BATCH_REQUESTS = metrics.histogram("voice_asr_batch_size", "Requests per ASR batch.",
+                                       buckets=(1, 2, 4, 8, 16, 32))
+ASR_RTF = metrics.histogram("voice_asr_real_time_factor", "ASR compute time over audio duration, per batch.",
+                            ["backend"], buckets=RATIO_BUCKETS)
+
+# LLM
+LLM_SECONDS = metrics.histogram("voice_llm_request_seconds", "LLM call latency until the full answer.", ["call"])
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram("voice_llm_first_token_seconds",
+                                            "Time to the first streamed LLM token.", ["call"])
+LLM_TOKENS = metrics.counter("voice_llm_tokens_total", "LLM tokens used.", ["call", "kind"])
+LLM_ERRORS = metrics.counter("voice_llm_errors_total", "LLM calls that failed.", ["call"])
+FAST_EXTRACTIONS = metrics.counter("voice_fast_extractions_total",
+                                   "Turns whose fields were extracted locally instead of by the LLM.")
+
+# TTS
+TTS_FIRST_BYTE_SECONDS = metrics.histogram("voice_tts_first_byte_seconds", "Time to the first TTS audio chunk.")
+TTS_SECONDS = metrics.histogram("voice_tts_seconds", "Time to synthesize a whole TTS utterance.")
+TTS_CACHE = metrics.counter("voice_tts_cache_total", "TTS cache lookups.", ["result"])
+
+# PDF
+PDF_RENDER_SECONDS = metrics.histogram("voice_pdf_render_seconds", "Time to render a filled PDF, queueing included.")
+PDF_JOBS = metrics.counter("voice_pdf_jobs_total", "Finished PDF jobs.", ["status"])
+
+# Admission control
+SHED = metrics.counter("voice_shed_total", "Work refused or displaced because a stage was full.", ["stage"])
+
+# Turns
+TURN_STAGE_SECONDS = metrics.histogram("voice_turn_stage_seconds", "Time per pipeline stage within a turn.",
+                                       ["stage"])
+TURNS = metrics.counter("voice_turns_total", "Completed conversational turns.")
+CANCELLED_TURNS = metrics.counter("voice_cancelled_turns_total",
+                                  "Turns dropped by barge-in or disconnect, by the stage they were in.", ["stage"])
+
+
+class TurnTrace:
+    """Spans of one turn, as offsets from the end of the caller's speech."""
+
+    def __init__(self, session_id, started):
+        self.session_id = session_id
+        self.started = started
+        self.wall_time = time.time()
+        self.spans = []
+
+    def add(self, name, end, seconds):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((end - seconds - self.started) * 1000, 1),
+            "duration_ms": round(seconds * 1000, 1)
+        })
+
+    def to_dict(self):
+        return {"session_id": self.session_id, "time": self.wall_time, "spans": self.spans}
+
+
+traces = deque(maxlen=METRICS_TRACE_HISTORY)
+
+
+def recent_traces(session_id=None):
+    return [trace.to_dict() for trace in traces if session_id is None or trace.session_id == session_id]
@@ -0,0 +1,77 @@
+# models.py
+import asyncio
+import threading
+import time
+import numpy as np
+import torch
+from asr_backends import ASR_BACKEND, create_backend
+
+
+class ModelRegistry:
+    """
+    Owns the Silero VAD model and the ASR backend (ASR_BACKEND). Nothing is
+    loaded at import: `load()` does it once (call it in a pre-fork master so
+    workers share the weights copy-on-write) and `start()` loads in the
+    background and runs a warm-up inference in this process before
+    reporting ready.
+    """
+
+    def __init__(self, asr_backend=ASR_BACKEND):
+        self.asr_backend_name = asr_backend
+        self.asr = None
+        self.vad = None
+        self.loaded = False
+        self.ready = False
+        self.error = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    @property
+    def status(self):
+        if self.error:
+            return "error"
+        if self.ready:
+            return "ready"
+        return "warming_up" if self.loaded else "loading"
+
+    def load(self):
+        with self._lock:
+            if self.loaded:
+                return
+            start = time.time()
+            self.vad, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=False)
+            asr = create_backend(self.asr_backend_name)
+            asr.load()
+            self.asr = asr
+            self.loaded = True
+            print(f"📦 Models loaded in {time.time() - start:.1f}s (asr={asr.name}, model={asr.model_name}).")
+
+    def warm_up(self):
+        """Runs each model once on synthetic audio so JIT and kernel setup happen before the first caller."""
+        start = time.time()
+        audio = (np.random.default_rng(0).standard_normal(16000) * 0.01).astype(np.float32)
+        with torch.no_grad():
+            vad = self.vad
+            vad.reset_states()
+            vad(torch.from_numpy(audio[:512]), 16000)
+            vad.reset_states()
+        # Not recorded in the backend's real-time factor
+        self.asr.transcribe_batch([(audio, None)])
+        print(f"🔥 Models warmed up in {time.time() - start:.1f}s.")
+
+    async def _load_and_warm_up(self):
+        try:
+            await asyncio.to_thread(self.load)
+            await asyncio.to_thread(self.warm_up)
+            self.ready = True
+        except Exception as e:
+            print("❌ Model loading failed:", e)
+            self.error = str(e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._load_and_warm_up())
+        return self._task
+
+
+registry = ModelRegistry()
@@ -0,0 +1,110 @@
+# pdf_jobs.py
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from fill_pdf_logic import render_pdf, load_template
+from metrics import PDF_JOBS, PDF_RENDER_SECONDS
+
+PDF_TEMPLATE_PATH = os.getenv("PDF_TEMPLATE_PATH", "form_template.pdf")
+PDF_JOB_WORKERS = int(os.getenv("PDF_JOB_WORKERS", "2"))
+
+
+class PDFJob:
+    def __init__(self, session_id, snapshot):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.snapshot = snapshot
+        self.status = "queued"
+        self.error = None
+        self.pdf_bytes = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.confirmed = False  # the user confirmed this version of the form
+
+    def to_dict(self):
+        info = {"job_id": self.job_id, "status": self.status}
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+class PDFJobManager:
+    """
+    Renders filled PDFs on a process pool so the event loop never waits on
+    PyMuPDF. A session's form is rendered as soon as it is complete; if the
+    form is unchanged by the time the user confirms, that job is reused.
+    Clients are only told a PDF is ready once its form is confirmed.
+    """
+
+    def __init__(self, template_path=PDF_TEMPLATE_PATH, workers=PDF_JOB_WORKERS):
+        self.template_path = template_path
+        self.workers = workers
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # By now this process runs model and ASR threads; forking it could copy a held lock and deadlock
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["fill_pdf_logic"])
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=load_template, initargs=(self.template_path,))
+        return self._executor
+
+    def submit(self, session):
+        snapshot = json.loads(json.dumps(session.form_data))
+        job = session.pdf_job
+        if job and job.snapshot == snapshot and job.status != "failed":
+            return job
+
+        job = PDFJob(session.session_id, snapshot)
+        session.pdf_job = job
+        job.future = asyncio.create_task(self._run(job, session))
+        return job
+
+    def confirm(self, session):
+        """Renders the form as it is now, if it changed since the last render, and announces it when ready."""
+        job = self.submit(session)
+        job.confirmed = True
+        if job.finished_at is not None:
+            asyncio.create_task(self._notify(job, session))
+        return job
+
+    async def _run(self, job, session):
+        job.status = "running"
+        loop = asyncio.get_running_loop()
+        try:
+            job.pdf_bytes = await loop.run_in_executor(
+                self._get_executor(), render_pdf, self.template_path, job.snapshot
+            )
+            job.status = "done"
+        except Exception as e:
+            print("❌ PDF job failed:", e)
+            job.status = "failed"
+            job.error = str(e)
+        job.finished_at = time.time()
+        PDF_RENDER_SECONDS.observe(job.finished_at - job.created_at)
+        PDF_JOBS.labels(job.status).inc()
+        if job.confirmed:
+            await self._notify(job, session)
+
+    async def _notify(self, job, session):
+        # Let a connected client know without polling
+        if session.websocket is not None and session.pdf_job is job:
+            message_type = "pdf_ready" if job.status == "done" else "pdf_failed"
+            try:
+                await session.websocket.send_text(json.dumps({"type": message_type, **job.to_dict()}))
+            except Exception:
+                pass
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pdf_jobs = PDFJobManager()
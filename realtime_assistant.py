@@ -1,34 +1,72 @@
+import asyncio
 import json
 import os
 import random
+import time
 from datetime import datetime
-import openai
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
-form_data = {"SiteCompanyName1": None,
-              "SiteAddress": None, 
-              "SiteCity": None, 
-              "SiteState": None, 
-              "SiteZip": None, 
-              "SiteVoice": None, 
-              "SiteFax": None, 
-              "CorporateCompanyName1": None, 
-              "CorporateAddress": None, 
-              "CorporateCity": None,
-                "CorporateState": None, 
-                "CorporateZip": None, 
-                "CorporateName": None, 
-                "SiteEmail": None, 
-                "CorporateVoice": None, 
-                "CorporateFax": None, 
-                "BusinessWebsite": None, 
-                "CorporateEmail": None,
-                  "CustomerSvcEmail": None,
-                "AppRetrievalMail": None, 
-                "AppRetrievalFax": None, 
-                "AppRetrievalFaxNumber": None, 
-                "MCC-Desc": None
-                }
+from conversation_context import build_messages, maybe_compact
+from dialogue_planner import DIALOGUE_PLANNER, PHRASES as PLANNER_PHRASES, can_plan, plan_reply
+from field_extractors import FAST_EXTRACT, extract_local
+from llm_client import StreamedArguments, llm, iter_sentences
+from metrics import FAST_EXTRACTIONS
+from pdf_jobs import pdf_jobs
+
+FORM_FIELDS = ["SiteCompanyName1",
+               "SiteAddress",
+               "SiteCity",
+               "SiteState",
+               "SiteZip",
+               "SiteVoice",
+               "SiteFax",
+               "CorporateCompanyName1",
+               "CorporateAddress",
+               "CorporateCity",
+               "CorporateState",
+               "CorporateZip",
+               "CorporateName",
+               "SiteEmail",
+               "CorporateVoice",
+               "CorporateFax",
+               "BusinessWebsite",
+               "CorporateEmail",
+               "CustomerSvcEmail",
+               "AppRetrievalMail",
+               "AppRetrievalFax",
+               "AppRetrievalFaxNumber",
+               "MCC-Desc"
+               ]
+
+
+# How fields are read back to the user
+FIELD_LABELS = {
+    "SiteCompanyName1": "DBA Name",
+    "SiteAddress": "Business Address",
+    "SiteCity": "City",
+    "SiteState": "State",
+    "SiteZip": "Zip",
+    "SiteVoice": "Phone",
+    "SiteFax": "Fax",
+    "CorporateCompanyName1": "Legal Corporate Name",
+    "CorporateAddress": "Corporate Address",
+    "CorporateCity": "Corporate City",
+    "CorporateState": "Corporate State",
+    "CorporateZip": "Corporate Zip",
+    "CorporateName": "Contact Name",
+    "SiteEmail": "Business Email",
+    "CorporateVoice": "Corporate Phone",
+    "CorporateFax": "Corporate Fax",
+    "BusinessWebsite": "Website",
+    "CorporateEmail": "Corporate Email",
+    "CustomerSvcEmail": "Customer Service Email",
+    "AppRetrievalMail": "Retrieval Requests By Mail",
+    "AppRetrievalFax": "Retrieval Requests By Fax",
+    "AppRetrievalFaxNumber": "Retrieval Fax Number",
+    "MCC-Desc": "MCC SIC Description",
+}
+
+
+def new_form_data():
+    return {field: None for field in FORM_FIELDS}
 
 # form_data = {
 #     "DBAName": None,
@@ -51,184 +89,343 @@ form_data = {"SiteCompanyName1": None,
 #     "MCCSICDescription": None
 # }
 
-conversation_history = []
-last_assistant_msg = ""
-end_triggered = False
-summary_given = False
-summary_confirmed = False
-
-
-def get_initial_assistant_message():
-    global last_assistant_msg
-    greetings = [
-        "Hi there! Ready to fill out your Merchant Application? Let's get started — what's your DBA or business name?",
-        "Hello! I’ll be helping you fill out your merchant form. Let’s begin with your business’s DBA name.",
-        "Welcome! Let’s kick things off. What’s the name your business operates under (DBA)?",
-        "Hey! I’ll guide you through your Merchant form. First, can you tell me your DBA or business name?",
-        "Great to have you! To start, what’s the doing-business-as (DBA) name for your company?"
-    ]
-    initial_message = random.choice(greetings)
-    last_assistant_msg = initial_message
-    conversation_history.append({
-        "role": "assistant",
-        "text": initial_message,
-        "timestamp": datetime.now().isoformat()
-    })
+
+GREETINGS = [
+    "Hi there! Ready to fill out your Merchant Application? Let's get started — what's your DBA or business name?",
+    "Hello! I’ll be helping you fill out your merchant form. Let’s begin with your business’s DBA name.",
+    "Welcome! Let’s kick things off. What’s the name your business operates under (DBA)?",
+    "Hey! I’ll guide you through your Merchant form. First, can you tell me your DBA or business name?",
+    "Great to have you! To start, what’s the doing-business-as (DBA) name for your company?"
+]
+
+ERROR_REPLY = "Sorry, I had trouble with that. Could you please repeat?"
+
+# Phrases spoken verbatim, worth synthesizing ahead of time
+FIXED_PHRASES = GREETINGS + [ERROR_REPLY] + PLANNER_PHRASES
+
+
+def get_initial_assistant_message(session):
+    initial_message = random.choice(GREETINGS)
+    add_message(session, "assistant", initial_message)
     return initial_message
 
 
-def build_summary_from_form():
+def build_summary_from_form(form_data):
     summary_lines = []
     for field, value in form_data.items():
         if value:
-            field_name = field.replace("MCCSICDescription", "MCC SIC Description").replace("DBAName", "DBA Name")
-            field_name = field_name.replace("LegalCorporateName", "Legal Corporate Name").replace("BusinessAddress", "Business Address")
-            field_name = field_name.replace("BillingAddress", "Billing Address").replace("CustomerServiceEmail", "Customer Service Email")
-            field_name = field_name.replace("RetrievalRequestDestination", "Retrieval Request Destination")
-            field_name = ' '.join([w.capitalize() for w in field_name.split()])
-            summary_lines.append(f"{field_name}: {value}")
+            summary_lines.append(f"{FIELD_LABELS.get(field, field)}: {value}")
     summary = "\n\nHere is a summary of the information collected:\n\n" + "\n".join(summary_lines)
     summary += "\n\nPlease confirm if all the details are correct. Once confirmed, it may take a few seconds to process."
     return summary
 
 
-async def process_transcribed_text(user_text):
-    global last_assistant_msg, end_triggered, summary_given, summary_confirmed
+# The names the form state and update_form use, with what each one means
+FIELD_LIST = "\n".join(f"- {field} ({FIELD_LABELS[field]})" for field in FORM_FIELDS)
 
-    conversation_history.append({
-        "role": "user",
-        "text": user_text,
-        "timestamp": datetime.now().isoformat()
-    })
+INSTRUCTION_PROMPT = f"""
+You are a conversational AI assistant helping users fill out a Merchant Processing Application.
 
-    # Extract structured fields from user response
-    extraction_prompt = f"""
-You are helping fill out a Merchant Processing Application. Based on the assistant's last question and the user's reply, extract any relevant fields from this list:
+Be intelligent, friendly, and natural—like Siri or ChatGPT. Guide the user through collecting the following fields only:
+
+{FIELD_LIST}
 
-{list(form_data.keys())}
+Ask one or two natural, context-aware questions at a time. Provide gentle examples if needed. Avoid robotic phrasing.
+Always prioritize privacy and remind the user not to share sensitive information unless necessary for the form. For sections requiring specific types of data like percentages, business types, or legal requirements, 
+offer examples to aid in understanding.Once all these fields are collected, read back the entire collected information to the user and ask them to confirm it and mention that it may take a few seconds to process all the information .
+ After they confirm respond with 'END OF CONVERSATION' and nothing else.
+
+DO NOT REPEAT THE SUMMARY. DO NOT REPEAT END OF CONVERSATION.
+"""
 
-Assistant: {last_assistant_msg}
-User: {user_text}
+# Static so the provider can cache it; the turn's specifics go in the user message
+EXTRACTION_PROMPT = f"""You extract structured form fields from user replies.
+You are helping fill out a Merchant Processing Application. Based on the assistant's last question and the user's reply, extract any relevant fields from this list:
+
+{FORM_FIELDS}
 
 Return only a valid JSON object using those exact field names. If nothing applies, return {{}}.
 """
 
+REPLY_TOOL_PROMPT = INSTRUCTION_PROMPT + (
+    "\nAlways answer by calling update_form with the form fields "
+    "found in the user's last message and your reply to them."
+)
+
+CONFIRMATION_PHRASES = ["yes", "correct", "confirmed", "looks good", "all good"]
+
+LLM_TURN_MODE = os.getenv("LLM_TURN_MODE", "single")  # "single", "concurrent" or "sequential"
+
+UPDATE_FORM_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "update_form",
+        "description": "Record the form fields given in the user's last reply and say the next thing to the user.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "fields": {
+                    "type": "object",
+                    "description": "Fields the user just provided, using these exact names. Empty if none.",
+                    "properties": {field: {"type": "string"} for field in FORM_FIELDS},
+                    "additionalProperties": False
+                },
+                "reply": {
+                    "type": "string",
+                    "description": "The assistant's next message to the user."
+                }
+            },
+            "required": ["fields", "reply"]
+        }
+    }
+}
+
+
+def add_message(session, role, text):
+    if role == "assistant":
+        session.last_assistant_msg = text
+    session.conversation_history.append({
+        "role": role,
+        "text": text,
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def apply_fields(form_data, parsed):
+    for key, value in parsed.items():
+        if key in form_data:
+            form_data[key] = value
+
+
+def timed(stage):
+    """Records how long the wrapped coroutine takes as a stage of the session's turn."""
+    def decorator(func):
+        async def wrapper(session, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(session, *args, **kwargs)
+            finally:
+                session.add_timing(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@timed("extraction")
+async def extract_fields(session, user_text):
+    """Asks the model which form fields the user's reply contains."""
     try:
-        extract_response = openai.ChatCompletion.create(
+        extract_response = await llm.chat(
             model="gpt-4",
             messages=[
-                {"role": "system", "content": "You extract structured form fields from user replies."},
-                {"role": "user", "content": extraction_prompt}
+                {"role": "system", "content": EXTRACTION_PROMPT},
+                {"role": "user", "content": f"Assistant: {session.last_assistant_msg}\nUser: {user_text}"}
             ],
-            temperature=0.2
+            temperature=0.2,
+            call="extract"
         )
         extracted_json = extract_response['choices'][0]['message']['content'].strip()
-        parsed = json.loads(extracted_json)
-        for key, value in parsed.items():
-            if key in form_data:
-                form_data[key] = value
+        return json.loads(extracted_json)
     except Exception as e:
         print("⚠️ Field extraction error:", e)
+        return {}
+
+
+@timed("reply")
+async def generate_reply(session, on_sentence=None):
+    """Generates the next assistant message, streaming sentences to on_sentence if given."""
+    messages = build_messages(session, INSTRUCTION_PROMPT)
+    if on_sentence:
+        sentences = []
+        async for sentence in iter_sentences(llm.stream_chat(messages, model="gpt-4", call="reply", temperature=0.4)):
+            sentences.append(sentence)
+            await on_sentence(sentence)
+        return " ".join(sentences).strip()
+
+    response = await llm.chat(
+        model="gpt-4",
+        messages=messages,
+        temperature=0.4,
+        call="reply"
+    )
+    return response['choices'][0]['message']['content'].strip()
+
+
+@timed("extract_and_reply")
+async def extract_and_reply(session, on_fields, on_sentence=None):
+    """
+    One round trip for both stages: the model returns the extracted fields
+    and its next message together through a forced function call. The call
+    is streamed, so on_fields gets the fields as soon as their JSON is
+    complete and, when on_sentence is given, the reply follows sentence by
+    sentence while it is generated (never before the fields). Returns the
+    reply.
+    """
+    messages = build_messages(session, REPLY_TOOL_PROMPT)
+    arguments = StreamedArguments("reply")
+    fields_sent = False
+
+    async def reply_deltas():
+        nonlocal fields_sent
+        async for delta in llm.stream_chat(
+            messages,
+            model="gpt-4",
+            tools=[UPDATE_FORM_TOOL],
+            tool_choice={"type": "function", "function": {"name": "update_form"}},
+            temperature=0.3,
+            call="extract_and_reply"
+        ):
+            text = arguments.feed(delta)
+            if not fields_sent and (fields := arguments.value("fields")) is not None:
+                fields_sent = True
+                on_fields(fields)
+            if text:
+                yield text
+
+    held = []
+    async for sentence in iter_sentences(reply_deltas()):
+        if on_sentence:
+            held.append(sentence)
+            if fields_sent:
+                for held_sentence in held:
+                    await on_sentence(held_sentence)
+                held.clear()
+
+    result = json.loads(arguments.text)
+    if not fields_sent:
+        on_fields(result.get("fields") or {})
+    for sentence in held:
+        await on_sentence(sentence)
+    return (result.get("reply") or "").strip()
+
+
+async def process_transcribed_text(session, user_text, on_sentence=None):
+    """
+    Updates the session's form from the user's reply and returns the
+    assistant's answer. When on_sentence is given, the reply is streamed and
+    each complete sentence is handed to it as soon as it is generated.
+
+    LLM_TURN_MODE picks how extraction and reply are obtained: "single"
+    makes one streamed function-calling request for both, "concurrent" runs
+    the two requests side by side, "sequential" runs extraction then reply.
+    Either way streamed sentences wait until the fields are known. When
+    the answer was a plain new value, the dialogue planner asks the next
+    question from a template instead of waiting for a generated reply.
+    """
+    form_data = session.form_data
+    add_message(session, "user", user_text)
+    maybe_compact(session)
+
+    # After the summary the reply may still be dropped below, so only stream before it
+    if session.summary_given:
+        on_sentence = None
+
+    reply_task = None
+    # Hold back streamed sentences until the fields say whether the reply will be used
+    extraction_done = asyncio.Event()
+
+    async def gated_sentence(sentence):
+        await extraction_done.wait()
+        await on_sentence(sentence)
 
+    # Zips, phone numbers, emails etc. answering the question just asked need no model to extract
+    parsed = extract_local(form_data, session.last_assistant_msg, user_text) if FAST_EXTRACT else None
+    if parsed:
+        FAST_EXTRACTIONS.inc()
+    elif LLM_TURN_MODE == "single":
+        fields_ready = asyncio.get_running_loop().create_future()
+        reply_task = asyncio.create_task(extract_and_reply(
+            session, fields_ready.set_result, gated_sentence if on_sentence else None
+        ))
+        try:
+            await asyncio.wait([fields_ready, reply_task], return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            reply_task.cancel()
+            raise
+        if fields_ready.done():
+            parsed = fields_ready.result()
+        else:
+            print("⚠️ Combined extraction/reply error, falling back to separate calls:", reply_task.exception())
+            reply_task = None
+            parsed = await extract_fields(session, user_text)
+    elif LLM_TURN_MODE == "concurrent":
+        reply_task = asyncio.create_task(generate_reply(session, gated_sentence if on_sentence else None))
+        try:
+            parsed = await extract_fields(session, user_text)
+        except BaseException:
+            reply_task.cancel()
+            raise
+    else:
+        parsed = await extract_fields(session, user_text)
+
+    # Plain answers get the next question from a template; corrections, doubts and questions go to the model
+    plannable = DIALOGUE_PLANNER and can_plan(form_data, parsed, user_text)
+    apply_fields(form_data, parsed)
     all_fields_filled = all(value is not None for value in form_data.values())
 
     # Show summary only once
-    if all_fields_filled and not summary_given:
-        summary_given = True
-        summary = build_summary_from_form()
-        last_assistant_msg = summary
-        conversation_history.append({
-            "role": "assistant",
-            "text": summary,
-            "timestamp": datetime.now().isoformat()
-        })
+    if all_fields_filled and not session.summary_given:
+        if reply_task:
+            reply_task.cancel()
+        session.summary_given = True
+        # Start rendering now so the PDF is usually ready by the time the user confirms
+        pdf_jobs.submit(session)
+        summary = build_summary_from_form(form_data)
+        add_message(session, "assistant", summary)
         return summary
 
     # Check for confirmation after summary
-    if summary_given and not summary_confirmed:
-        if any(phrase in user_text.lower() for phrase in ["yes", "correct", "confirmed", "looks good", "all good"]):
-            summary_confirmed = True
-            end_triggered = True
+    if session.summary_given and not session.summary_confirmed:
+        if any(phrase in user_text.lower() for phrase in CONFIRMATION_PHRASES):
+            if reply_task:
+                reply_task.cancel()
+            session.summary_confirmed = True
+            session.end_triggered = True
+            # Picks up corrections made after the summary; reuses the speculative render otherwise
+            pdf_jobs.confirm(session)
             final_msg = "END OF CONVERSATION"
-            last_assistant_msg = final_msg
-            conversation_history.append({
-                "role": "assistant",
-                "text": final_msg,
-                "timestamp": datetime.now().isoformat()
-            })
+            add_message(session, "assistant", final_msg)
             return final_msg
 
     # Otherwise, keep asking remaining questions
-    instruction_prompt = """
-You are a conversational AI assistant helping users fill out a Merchant Processing Application.
-
-Be intelligent, friendly, and natural—like Siri or ChatGPT. Guide the user through collecting the following fields only:
-
-- DBAName
-- LegalCorporateName
-- BusinessAddress
-- BillingAddress
-- City
-- State
-- Zip
-- Phone
-- Fax
-- ContactName
-- BusinessEmail
-- ContactPhone
-- ContactFax
-- ContactEmail
-- Website
-- CustomerServiceEmail
-- RetrievalRequestDestination
-- MCCSICDescription
-
-Ask one or two natural, context-aware questions at a time. Provide gentle examples if needed. Avoid robotic phrasing.
-Always prioritize privacy and remind the user not to share sensitive information unless necessary for the form. For sections requiring specific types of data like percentages, business types, or legal requirements, 
-offer examples to aid in understanding.Once all these fields are collected, read back the entire collected information to the user and ask them to confirm it and mention that it may take a few seconds to process all the information .
- After they confirm respond with 'END OF CONVERSATION' and nothing else.
-
-DO NOT REPEAT THE SUMMARY. DO NOT REPEAT END OF CONVERSATION.
-"""
+    planned = plan_reply(form_data, len(session.conversation_history)) if plannable else None
+    if planned:
+        if reply_task:
+            reply_task.cancel()
+        if on_sentence:
+            for sentence in planned:
+                await on_sentence(sentence)
+        assistant_reply = " ".join(planned)
+        add_message(session, "assistant", assistant_reply)
+        return assistant_reply
 
     try:
-        messages = [
-            {"role": "system", "content": instruction_prompt}
-        ] + [
-            {"role": msg["role"], "content": msg["text"]}
-            for msg in conversation_history[-12:]
-        ]
-
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.4
-        )
-        assistant_reply = response['choices'][0]['message']['content'].strip()
+        if reply_task:
+            extraction_done.set()
+            assistant_reply = await reply_task
+        else:
+            assistant_reply = await generate_reply(session, on_sentence)
 
-        if summary_given and ("summary" in assistant_reply.lower() or "end of conversation" in assistant_reply.lower()):
+        if session.summary_given and ("summary" in assistant_reply.lower() or "end of conversation" in assistant_reply.lower()):
             return ""  # avoid repetition
 
-        last_assistant_msg = assistant_reply
-        conversation_history.append({
-            "role": "assistant",
-            "text": assistant_reply,
-            "timestamp": datetime.now().isoformat()
-        })
-
+        add_message(session, "assistant", assistant_reply)
         return assistant_reply
 
     except Exception as e:
         print("❌ Assistant generation error:", e)
-        return "Sorry, I had trouble with that. Could you please repeat?"
-
-
-def reset_assistant_state():
-    global conversation_history, last_assistant_msg, end_triggered, summary_given, summary_confirmed
-    conversation_history.clear()
-    last_assistant_msg = ""
-    end_triggered = False
-    summary_given = False
-    summary_confirmed = False
-    for key in form_data:
-        form_data[key] = None
+        return ERROR_REPLY
+
+
+def reset_assistant_state(session):
+    if session.compaction_task is not None:
+        session.compaction_task.cancel()
+        session.compaction_task = None
+    session.conversation_history.clear()
+    session.context_summary = ""
+    session.last_assistant_msg = ""
+    session.end_triggered = False
+    session.summary_given = False
+    session.summary_confirmed = False
+    session.pdf_job = None
+    for key in session.form_data:
+        session.form_data[key] = None
@@ -0,0 +1,214 @@
+# session_manager.py
+import asyncio
+import json
+import os
+import time
+import uuid
+from metrics import METRICS_TRACE_TURNS, TurnTrace, metrics
+from realtime_assistant import new_form_data
+from session_store import create_store, dumps, history_delta
+
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))  # seconds
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# Conversation state kept in the session store besides the form and the history
+PERSISTED_ATTRS = ("context_summary", "last_assistant_msg", "end_triggered", "summary_given", "summary_confirmed")
+HISTORY_KEYS = ("role", "text", "timestamp")
+
+
+class Session:
+    """
+    All per-caller state: the form being filled, the conversation so far and
+    the audio/interrupt bookkeeping used by the WebSocket handler.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.connections = 0
+
+        # Conversation state
+        self.form_data = new_form_data()
+        self.conversation_history = []  # recent messages; older ones are folded into context_summary
+        self.context_summary = ""
+        self.compaction_task = None
+        self.last_assistant_msg = ""
+        self.end_triggered = False
+        self.summary_given = False
+        self.summary_confirmed = False
+        # The state as last written to the session store, to save only what changed since
+        self.stored = None
+
+        # Audio state; the capture pipeline (resampler, VAD, buffer, transcriber) belongs to the connection
+        self.binary_protocol = False
+        self.stream_tts = False
+        self.reply_seq = 0
+        self.currently_playing_audio = None
+        self.last_assistant_tts_time = 0
+        # The turn being answered, and the stage it is in; barge-in cancels it
+        self.turn_task = None
+        self.turn_stage = None
+        # An utterance whose transcription barge-in cancelled, heard again with the next one
+        self.carryover_samples = None
+
+        # Stage timings (seconds) of the current turn, and of audio heard since the last one
+        self.report_timings = False
+        self.turn_started = None
+        self.turn_timings = {}
+        self.listen_timings = {}
+        self.trace = None
+
+        # Connected client, if any, for out-of-band notifications
+        self.websocket = None
+
+        # Latest PDF render job for this session's form
+        self.pdf_job = None
+
+    def add_timing(self, stage, seconds, listening=False):
+        timings = self.listen_timings if listening else self.turn_timings
+        timings[stage] = timings.get(stage, 0.0) + seconds
+        if self.trace is not None and not listening:
+            self.trace.add(stage, time.perf_counter(), seconds)
+
+    def start_turn(self):
+        self.turn_started = time.perf_counter()
+        self.turn_timings, self.listen_timings = self.listen_timings, {}
+        self.trace = TurnTrace(self.session_id, self.turn_started) if METRICS_TRACE_TURNS else None
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def state(self):
+        """The conversation state as store fields and history entries, each serialized as compact JSON."""
+        fields = {"form." + field: dumps(value) for field, value in self.form_data.items()}
+        fields.update((attr, dumps(getattr(self, attr))) for attr in PERSISTED_ATTRS)
+        history = [dumps([msg.get(key) for key in HISTORY_KEYS]) for msg in self.conversation_history]
+        return fields, history
+
+    def restore(self, fields, history):
+        for key, value in fields.items():
+            if key.startswith("form."):
+                if key[5:] in self.form_data:
+                    self.form_data[key[5:]] = json.loads(value)
+            elif key in PERSISTED_ATTRS:
+                setattr(self, key, json.loads(value))
+        # A new list, so a compaction still running on the old one leaves this alone
+        self.conversation_history = [dict(zip(HISTORY_KEYS, json.loads(entry))) for entry in history]
+        self.stored = (fields, history)
+
+    def is_idle(self, now=None):
+        now = now or time.time()
+        return self.connections == 0 and now - self.last_active > SESSION_IDLE_TIMEOUT
+
+    def close(self):
+        if self.compaction_task is not None:
+            self.compaction_task.cancel()
+            self.compaction_task = None
+        self.pdf_job = None
+        self.websocket = None
+
+
+class SessionManager:
+    """
+    Live sessions of this worker, backed by a session store. Sessions this
+    worker doesn't have (or, with a shared store, isn't connected to and so
+    may be stale) are loaded from the store, so any worker can serve any
+    session and a caller can reconnect anywhere and pick up mid-form.
+    """
+
+    def __init__(self, store=None):
+        self._sessions = {}
+        self._sweeper = None
+        self.store = store or create_store()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def connection_count(self):
+        return sum(s.connections for s in self._sessions.values())
+
+    async def get(self, session_id):
+        if not session_id:
+            return None
+        session = self._sessions.get(session_id)
+        if session is None or (self.store.shared and session.connections == 0):
+            try:
+                stored = await self.store.load(session_id)
+            except Exception as e:
+                print("⚠️ Session store load failed:", e)
+                stored = None
+            if stored is not None:
+                if session is None:
+                    session = Session(session_id)
+                    self._sessions[session_id] = session
+                session.restore(*stored)
+        if session:
+            session.touch()
+        return session
+
+    async def get_or_create(self, session_id=None):
+        session = await self.get(session_id)
+        if session is None:
+            session_id = session_id or uuid.uuid4().hex
+            session = Session(session_id)
+            self._sessions[session_id] = session
+        return session
+
+    async def save(self, session):
+        """
+        Writes what changed since the last save: changed fields, new history
+        entries and how many old ones compaction dropped. Also renews the
+        TTL. A failed save is logged and the next one rewrites everything.
+        """
+        fields, history = session.state()
+        if session.stored is None:
+            changes, dropped, appended = fields, 0, history
+        else:
+            stored_fields, stored_history = session.stored
+            changes = {key: value for key, value in fields.items() if stored_fields.get(key) != value}
+            dropped, appended = history_delta(stored_history, history)
+        replace = session.stored is None
+        session.stored = (fields, history)
+        try:
+            await self.store.save(session.session_id, changes, appended, dropped, replace)
+        except Exception as e:
+            print("⚠️ Session store save failed:", e)
+            session.stored = None
+
+    def remove(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session:
+            session.close()
+
+    def evict_idle(self):
+        now = time.time()
+        idle = [sid for sid, s in self._sessions.items() if s.is_idle(now)]
+        for sid in idle:
+            self.remove(sid)
+        if idle:
+            print(f"🧹 Evicted {len(idle)} idle session(s), {len(self._sessions)} active.")
+        return len(idle)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+            self.evict_idle()
+            self.store.purge()
+
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+sessions = SessionManager()
+
+metrics.gauge("voice_active_sessions", "Sessions held in memory.", function=lambda: len(sessions))
+metrics.gauge("voice_connected_sessions", "Sessions with an open WebSocket.",
+              function=lambda: sum(1 for s in sessions._sessions.values() if s.connections > 0))
+metrics.gauge("voice_connections", "Open /ws/audio connections.", function=sessions.connection_count)
@@ -0,0 +1,252 @@
+# session_store.py
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "")  # redis://[:password@]host:port/db; empty keeps sessions in-process
+SESSION_STORE_TTL = int(float(os.getenv("SESSION_STORE_TTL", os.getenv("SESSION_IDLE_TIMEOUT", "1800"))))  # seconds
+SESSION_STORE_PREFIX = os.getenv("SESSION_STORE_PREFIX", "voice:session:")
+SESSION_STORE_TIMEOUT = float(os.getenv("SESSION_STORE_TIMEOUT", "2"))  # seconds per connect or round trip
+
+
+def dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def history_delta(old, new):
+    """
+    How to turn the stored history `old` into `new`: (dropped, appended),
+    i.e. drop that many entries from the front and append the rest. Covers
+    new messages, compaction dropping old ones and (dropping everything)
+    resets.
+    """
+    for dropped in range(len(old) + 1):
+        kept = len(old) - dropped
+        if new[:kept] == old[dropped:]:
+            return dropped, new[kept:]
+
+
+class SessionStore:
+    """
+    Where session state outlives a worker. A session is a flat map of
+    serialized fields plus an append-only list of serialized history
+    entries, so each save only carries what changed. Both expire `ttl`
+    seconds after the last save.
+    """
+
+    # Whether other workers write to the same store, so local copies can go stale
+    shared = False
+
+    def __init__(self, ttl=SESSION_STORE_TTL):
+        self.ttl = ttl
+
+    async def load(self, session_id):
+        """Returns (fields, history) or None if the session is unknown or expired."""
+        raise NotImplementedError
+
+    async def save(self, session_id, fields, appended=(), dropped=0, replace=False):
+        """Updates `fields`, drops `dropped` history entries from the front and appends `appended`."""
+        raise NotImplementedError
+
+    async def delete(self, session_id):
+        raise NotImplementedError
+
+    def purge(self):
+        """Drops expired sessions, for stores that don't expire them by themselves."""
+
+    async def close(self):
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Keeps sessions in this process; enough for a single worker."""
+
+    def __init__(self, ttl=SESSION_STORE_TTL):
+        super().__init__(ttl)
+        self._data = {}
+
+    async def load(self, session_id):
+        entry = self._data.get(session_id)
+        if entry is None or entry[2] < time.time():
+            return None
+        fields, history, _ = entry
+        return dict(fields), list(history)
+
+    async def save(self, session_id, fields, appended=(), dropped=0, replace=False):
+        entry = self._data.get(session_id)
+        if replace or entry is None or entry[2] < time.time():
+            entry = ({}, [], 0)
+        stored_fields, history, _ = entry
+        stored_fields.update(fields)
+        del history[:dropped]
+        history.extend(appended)
+        self._data[session_id] = (stored_fields, history, time.time() + self.ttl)
+
+    async def delete(self, session_id):
+        self._data.pop(session_id, None)
+
+    def purge(self):
+        now = time.time()
+        for session_id in [sid for sid, entry in self._data.items() if entry[2] < now]:
+            del self._data[session_id]
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args):
+    """A command as a RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    """Reads one RESP reply. Error replies are returned as RedisError, not raised, so a pipeline stays in sync."""
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        return RedisError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2].decode("utf-8")
+    if kind == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"unexpected reply {line!r}")
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Keeps sessions in Redis (or anything speaking its protocol, like the
+    bench.redis_stub stand-in) so every worker and node sees the same
+    state. Fields live in a hash and history in a list next to it; a save
+    is one MULTI/EXEC pipeline of HSET, LTRIM, RPUSH and EXPIRE. Connecting
+    and each round trip give up after `timeout` seconds, as does a call
+    still waiting for the connection by then, so a stalled Redis fails
+    loads and saves instead of hanging them.
+    """
+
+    shared = True
+
+    def __init__(self, url, ttl=SESSION_STORE_TTL, prefix=SESSION_STORE_PREFIX, timeout=SESSION_STORE_TIMEOUT):
+        super().__init__(ttl)
+        self.timeout = timeout
+        parsed = urlsplit(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            await self._send(setup)
+
+    async def _send(self, commands):
+        self._writer.write(b"".join(encode_command(*command) for command in commands))
+        await self._writer.drain()
+        replies = [await read_reply(self._reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def _execute(self, commands, deadline):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            if loop.time() > deadline:
+                raise RedisError(f"timed out after {self.timeout}s waiting for the connection")
+            try:
+                if self._writer is None:
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                return await asyncio.wait_for(self._send(commands), self.timeout)
+            except asyncio.TimeoutError as e:
+                # A reply may still be on its way, so the connection can't be reused
+                self._disconnect()
+                raise RedisError(f"timed out after {self.timeout}s") from e
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                self._disconnect()
+                raise
+
+    async def execute(self, *commands):
+        """
+        Sends `commands` as one pipeline and returns their replies. Shielded
+        so a cancelled caller can't leave half a pipeline on the connection.
+        """
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        return await asyncio.shield(self._execute(commands, deadline))
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    def _keys(self, session_id):
+        key = self.prefix + session_id
+        return key, key + ":history"
+
+    async def load(self, session_id):
+        key, history_key = self._keys(session_id)
+        fields, history = await self.execute(("HGETALL", key), ("LRANGE", history_key, 0, -1))
+        if not fields:
+            return None
+        return dict(zip(fields[::2], fields[1::2])), history
+
+    async def save(self, session_id, fields, appended=(), dropped=0, replace=False):
+        key, history_key = self._keys(session_id)
+        commands = [("MULTI",)]
+        if replace:
+            commands.append(("DEL", key, history_key))
+        if fields:
+            commands.append(("HSET", key, *(part for item in fields.items() for part in item)))
+        if dropped:
+            commands.append(("LTRIM", history_key, dropped, -1))
+        if appended:
+            commands.append(("RPUSH", history_key, *appended))
+        commands += [("EXPIRE", key, self.ttl), ("EXPIRE", history_key, self.ttl), ("EXEC",)]
+        results = (await self.execute(*commands))[-1]
+        # Errors inside the transaction come back as entries of EXEC's reply; None means it was aborted
+        if results is None:
+            raise RedisError("transaction aborted")
+        for result in results:
+            if isinstance(result, RedisError):
+                raise result
+
+    async def delete(self, session_id):
+        await self.execute(("DEL", *self._keys(session_id)))
+
+    async def close(self):
+        async with self._lock:
+            self._disconnect()
+
+
+def create_store(url=SESSION_STORE_URL):
+    if not url:
+        return InMemorySessionStore()
+    if url.startswith("redis://"):
+        return RedisSessionStore(url)
+    raise ValueError(f"Unsupported SESSION_STORE_URL (expected redis://...): {url}")
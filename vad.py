@@ -1,13 +1,114 @@
 # vad.py
+import asyncio
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import numpy as np
+from models import registry
 
-# Load Silero VAD model and utilities from torch hub
-model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=False)
-(get_speech_timestamps, _, read_audio, _, _) = utils
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.5"))
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "700"))        # silence that ends an utterance
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))  # speech needed to count as an utterance
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))        # audio kept from before speech starts
+VAD_FRAME_SAMPLES = 512  # Silero scores 512-sample (32 ms) frames at 16 kHz
+VAD_THREADS = int(os.getenv("VAD_THREADS", "1"))  # threads scoring frames, each with its own model instance
+# Where Silero keeps a stream's recurrent state (v5 uses _state/_context, v4 _h/_c)
+VAD_STATE_ATTRS = ("_state", "_context", "_h", "_c", "_last_sr", "_last_batch_size")
 
-def is_speech(audio_bytes: bytes, sample_rate=16000) -> bool:
-    audio_np = np.frombuffer(audio_bytes, np.int16).astype(np.float32) / 32768.0
-    audio_tensor = torch.tensor(audio_np, dtype=torch.float32)
-    timestamps = get_speech_timestamps(audio_tensor, model, sampling_rate=sample_rate)
-    return len(timestamps) >= 1  # Require at least 3 confident speech segments
+_executor = ThreadPoolExecutor(max_workers=VAD_THREADS, thread_name_prefix="vad")
+_thread_models = threading.local()
+_models_lock = threading.Lock()
+_shared_model_taken = False
+
+
+def _thread_model():
+    """This VAD thread's model: the registry's own for the first thread, a copy for any others."""
+    global _shared_model_taken
+    model = getattr(_thread_models, "model", None)
+    if model is None:
+        with _models_lock:
+            model = copy.deepcopy(registry.vad) if _shared_model_taken else registry.vad
+            _shared_model_taken = True
+        _thread_models.model = model
+    return model
+
+
+def run_in_vad_thread(function, *args):
+    """
+    Runs `function` (typically resampling a chunk and feeding it to a
+    StreamingVAD) on a VAD thread, off the event loop.
+    """
+    return asyncio.get_running_loop().run_in_executor(_executor, function, *args)
+
+
+class StreamingVAD:
+    """
+    Scores each frame as it arrives and decides end-of-utterance on the
+    server. Silero keeps its recurrent state on the model, so the model is
+    shared and each stream only keeps that state, swapping it in and out
+    around its frames. `feed` must run on a VAD thread (run_in_vad_thread).
+    """
+
+    def __init__(self, sample_rate=16000, threshold=VAD_THRESHOLD, silence_ms=VAD_SILENCE_MS,
+                 min_speech_ms=VAD_MIN_SPEECH_MS):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.silence_ms = silence_ms
+        self.min_speech_ms = min_speech_ms
+        self.frame_ms = VAD_FRAME_SAMPLES * 1000 / sample_rate
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self._state = None  # fresh recurrent state on the next frame
+        self._pending = self._pending[:0]
+        self.triggered = False
+        self.speech_ms = 0.0
+        self.trailing_silence_ms = 0.0
+
+    def feed(self, samples: np.ndarray) -> list:
+        """
+        Feeds 16 kHz float32 samples and returns the events it produced:
+        "speech_start" once speech is confirmed and "speech_end" once the
+        silence window has elapsed after it.
+        """
+        events = []
+        pending = np.concatenate((self._pending, samples)) if len(self._pending) else samples
+        n_frames = len(pending) // VAD_FRAME_SAMPLES
+        self._pending = pending[n_frames * VAD_FRAME_SAMPLES:]
+        if not n_frames:
+            return events
+
+        # The frames are a view of the same samples the ASR will see, not a second conversion
+        frames = torch.from_numpy(np.ascontiguousarray(pending[:n_frames * VAD_FRAME_SAMPLES]))
+        frames = frames.view(n_frames, VAD_FRAME_SAMPLES)
+
+        model = _thread_model()
+        if self._state is None:
+            model.reset_states()
+        else:
+            for attr, value in self._state.items():
+                setattr(model, attr, value)
+        with torch.no_grad():
+            for frame in frames:
+                prob = model(frame, self.sample_rate).item()
+                if prob >= self.threshold:
+                    self.speech_ms += self.frame_ms
+                    self.trailing_silence_ms = 0.0
+                    if not self.triggered and self.speech_ms >= self.min_speech_ms:
+                        self.triggered = True
+                        events.append("speech_start")
+                elif self.triggered:
+                    # Hysteresis: only clearly non-speech frames count towards the silence window
+                    if prob < self.threshold - 0.15:
+                        self.trailing_silence_ms += self.frame_ms
+                    if self.trailing_silence_ms >= self.silence_ms:
+                        events.append("speech_end")
+                        self.reset()
+                        return events
+                else:
+                    self.speech_ms = 0.0
+        self._state = {attr: getattr(model, attr) for attr in VAD_STATE_ATTRS if hasattr(model, attr)}
+        return events
@@ -3,157 +3,641 @@ import asyncio
 import json
 import base64
 import os
-import tempfile
-import wave
-import audioop
+import struct
+import threading
 import time
+import numpy as np
 from fastapi import APIRouter, WebSocket
 from dotenv import load_dotenv
 from elevenlabs.client import ElevenLabs
-import openai
-import torch
-import whisper
-from whisper import Whisper
-from realtime_assistant import process_transcribed_text, get_initial_assistant_message
-from vad import is_speech
+from admission import (BUSY_RETRY_SECONDS, PRIORITY_FINAL, PRIORITY_FOLLOWUP, PRIORITY_PREWARM, Overloaded,
+                       connection_limiter, tts_limiter)
+from asr import BatchedASRWorker, StreamingTranscriber
+from audio_utils import PCMBuffer, StreamingResampler
+from metrics import (CANCELLED_TURNS, RESAMPLE_SECONDS, SHED, VAD_SECONDS, TTS_CACHE, TTS_FIRST_BYTE_SECONDS,
+                     TTS_SECONDS, TURN_STAGE_SECONDS, TURNS, metrics, traces)
+from models import registry
+from realtime_assistant import process_transcribed_text, get_initial_assistant_message, FIXED_PHRASES
+from session_manager import sessions
+from tts_cache import tts_cache
+from vad import StreamingVAD, VAD_PREROLL_MS, run_in_vad_thread
 
 load_dotenv()
 router = APIRouter()
-model: Whisper = whisper.load_model("small")  # Upgraded model for better accuracy
+asr_worker = BatchedASRWorker(lambda: registry.asr)
+metrics.gauge("voice_asr_queued", "ASR requests waiting for a batch.", function=lambda: len(asr_worker._queue or ()))
 
-tts = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL")  # point at a local stand-in for offline runs
+tts = ElevenLabs(
+    api_key=os.getenv("ELEVENLABS_API_KEY"),
+    **({"base_url": ELEVENLABS_BASE_URL} if ELEVENLABS_BASE_URL else {})
+)
 
-currently_playing_audio = None
-last_assistant_tts_time = 0
-interrupted = False
+INPUT_SAMPLE_RATE = 48000
+ASR_SAMPLE_RATE = 16000
+MAX_UTTERANCE_SECONDS = 8
+MAX_UTTERANCE_BYTES = ASR_SAMPLE_RATE * 4 * MAX_UTTERANCE_SECONDS  # buffered 16 kHz float32 per utterance
+MAX_CHUNK_BYTES = INPUT_SAMPLE_RATE * 2  # one second of 48 kHz int16 per audio frame
+STREAMING_ASR = os.getenv("STREAMING_ASR", "1") == "1"  # send partial transcripts while the user speaks
+TTS_VOICE_ID = "EXAVITQu4vr4xnSDxMaL"
+TTS_MODEL_ID = "eleven_monolingual_v1"
+TTS_CACHED_CHUNK_BYTES = 32 * 1024
+PROCESSING_ERROR_REPLY = "Sorry, I had trouble processing that. Could you please repeat?"
+# Only fixed phrases are cached; generated replies (like the summary read-back) carry form values
+CACHED_PHRASES = frozenset(FIXED_PHRASES + [PROCESSING_ERROR_REPLY])
+_PHRASES_LONGEST_FIRST = sorted(CACHED_PHRASES, key=len, reverse=True)
 
 def generate_tts(assistant_text):
-    audio_reply = tts.text_to_speech.convert(
-        voice_id="EXAVITQu4vr4xnSDxMaL",
-        model_id="eleven_monolingual_v1",
-        text=assistant_text
-    )
-    return b"".join(audio_reply)
+    cacheable = assistant_text in CACHED_PHRASES
+    if cacheable:
+        cached = tts_cache.get(assistant_text, TTS_VOICE_ID, TTS_MODEL_ID)
+        TTS_CACHE.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return cached
+    with TTS_SECONDS.time():
+        audio_reply = tts.text_to_speech.convert(
+            voice_id=TTS_VOICE_ID,
+            model_id=TTS_MODEL_ID,
+            text=assistant_text
+        )
+        audio_bytes = b"".join(audio_reply)
+    if cacheable:
+        tts_cache.put(assistant_text, TTS_VOICE_ID, TTS_MODEL_ID, audio_bytes)
+    return audio_bytes
 
-@router.websocket("/ws/audio")
-async def audio_websocket(websocket: WebSocket):
-    await websocket.accept()
-    audio_buffer = b""
-    global currently_playing_audio, last_assistant_tts_time, interrupted
 
-    try:
-        initial_text = get_initial_assistant_message()
-        audio_bytes = await asyncio.to_thread(generate_tts, initial_text)
-        audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-        last_assistant_tts_time = time.time()
+def split_cached_phrases(text):
+    """
+    `text` as the cached phrases it is made of, like a planner reply ("Got
+    it." and the next question), so each is served from cache; [text] when
+    it isn't made of them.
+    """
+    phrases = []
+    rest = text
+    while rest:
+        phrase = next((p for p in _PHRASES_LONGEST_FIRST if rest == p or rest.startswith(p + " ")), None)
+        if phrase is None:
+            return [text]
+        phrases.append(phrase)
+        rest = rest[len(phrase):].lstrip(" ")
+    return phrases
 
-        await websocket.send_text(json.dumps({
-            "type": "assistant_reply",
-            "text": initial_text,
-            "audio_b64": audio_b64
-        }))
 
-        while True:
-            msg = await websocket.receive_text()
-            data = json.loads(msg)
+async def prewarm_tts_cache():
+    """Synthesizes the greetings and fixed error phrases so they are served from cache."""
+    for phrase in FIXED_PHRASES + [PROCESSING_ERROR_REPLY]:
+        if tts_cache.get(phrase, TTS_VOICE_ID, TTS_MODEL_ID) is not None:
+            continue
+        try:
+            async with tts_limiter.slot(PRIORITY_PREWARM):
+                await asyncio.to_thread(generate_tts, phrase)
+        except Overloaded:
+            print("⚠️ TTS busy, leaving the rest of the cache cold.")
+            return
+        except Exception as e:
+            print("⚠️ TTS pre-synthesis failed:", e)
+            return
+    print("🔥 TTS cache warmed with fixed phrases.")
 
-            if data["type"] == "audio_chunk":
-                interrupted = True
-                if currently_playing_audio:
-                    currently_playing_audio.cancel()
-                    currently_playing_audio = None
-                    await websocket.send_text(json.dumps({"type": "interrupt_audio"}))
-                    print("⛔️ Assistant TTS interrupted by user.")
-                audio_buffer += base64.b64decode(data["data"])
 
-            elif data["type"] == "end_stream":
-                await asyncio.sleep(0.2)
-                resampled = audioop.ratecv(audio_buffer, 2, 1, 48000, 16000, None)[0]
+async def stream_tts(assistant_text, priority=PRIORITY_FINAL):
+    """
+    Yields audio chunks as ElevenLabs produces them. The blocking SDK
+    generator runs on a worker thread; closing this generator (e.g. when the
+    reply task is cancelled) stops it after the current chunk. Syntheses
+    share the TTS limiter's slots; raises Overloaded when none is free.
+    """
+    cacheable = assistant_text in CACHED_PHRASES
+    if cacheable:
+        cached = await asyncio.to_thread(tts_cache.get, assistant_text, TTS_VOICE_ID, TTS_MODEL_ID)
+        TTS_CACHE.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            for start in range(0, len(cached), TTS_CACHED_CHUNK_BYTES):
+                yield cached[start:start + TTS_CACHED_CHUNK_BYTES]
+            return
 
-                duration_seconds = len(resampled) / 32000
-                if duration_seconds > 8:
-                    print("🛑 Audio too long (>8s), skipping.")
-                    audio_buffer = b""
-                    continue
+    api = tts.text_to_speech
+    # The streaming endpoint is `stream` in newer SDKs and `convert_as_stream` in older ones
+    convert_stream = getattr(api, "stream", None) or getattr(api, "convert_as_stream", None) or api.convert
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
 
-                if time.time() - last_assistant_tts_time < 1.0:
-                    print("🛑 Skipping input: too soon after TTS.")
-                    audio_buffer = b""
-                    continue
+    def produce():
+        chunks = None
+        try:
+            chunks = convert_stream(voice_id=TTS_VOICE_ID, model_id=TTS_MODEL_ID, text=assistant_text)
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                if chunk:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
 
-                if not is_speech(resampled):
-                    print("🛑 VAD: No speech detected.")
-                    audio_buffer = b""
-                    continue
+    async with tts_limiter.slot(priority):
+        start = time.perf_counter()
+        loop.run_in_executor(None, produce)
+        chunks = []
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if not chunks:
+                    TTS_FIRST_BYTE_SECONDS.observe(time.perf_counter() - start)
+                chunks.append(item)
+                yield item
+        finally:
+            stop.set()
+    TTS_SECONDS.observe(time.perf_counter() - start)
+    # Only complete utterances are cached; an interrupted stream never gets here
+    if cacheable:
+        await asyncio.to_thread(tts_cache.put, assistant_text, TTS_VOICE_ID, TTS_MODEL_ID, b"".join(chunks))
+
+
+
+async def send_assistant_reply(websocket, session, text, audio_bytes=None):
+    """
+    JSON clients get the audio inline as base64. Binary clients get the JSON
+    header followed by the raw audio as a single binary frame.
+    """
+    message = {"type": "assistant_reply", "text": text}
+    send_start = time.perf_counter()
+    mark_first_audio(session)
+    if audio_bytes and session.binary_protocol:
+        message["audio_bytes"] = len(audio_bytes)
+        await websocket.send_text(json.dumps(message))
+        await websocket.send_bytes(audio_bytes)
+    else:
+        if audio_bytes:
+            message["audio_b64"] = base64.b64encode(audio_bytes).decode("utf-8")
+        await websocket.send_text(json.dumps(message))
+    session.add_timing("send", time.perf_counter() - send_start)
+    await report_turn_timings(websocket, session)
+
+
+def mark_first_audio(session):
+    if session.turn_started is not None and "first_audio" not in session.turn_timings:
+        session.turn_timings["first_audio"] = time.perf_counter() - session.turn_started
 
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_audio:
-                    with wave.open(tmp_audio, 'wb') as wf:
-                        wf.setnchannels(1)
-                        wf.setsampwidth(2)
-                        wf.setframerate(16000)
-                        wf.writeframes(resampled)
-                    tmp_path = tmp_audio.name
-
-                result = await asyncio.to_thread(model.transcribe, tmp_path, language='en', task='transcribe')
-                os.remove(tmp_path)
-                transcript = result.get("text", "").strip()
-
-                if not transcript or len(transcript.split()) < 2 or transcript.lower().count("sí") > 8:
-                    print("🛑 Ignoring hallucinated transcript.")
-                    audio_buffer = b""
-                    continue
 
-                print("🎤 User said:", transcript)
-                await websocket.send_text(json.dumps({
-                    "type": "transcript",
-                    "text": transcript
-                }))
-
-                try:
-                    assistant_text = await asyncio.wait_for(process_transcribed_text(transcript), timeout=10.0)
-                    if not assistant_text:
-                        raise ValueError("No assistant response.")
-                except Exception as e:
-                    print("⚠️ Assistant failed:", e)
+async def report_turn_timings(websocket, session):
+    """
+    Records the finished turn's per-stage timings (and its trace, if traced)
+    and sends them to clients that connected with ?timings=1.
+    """
+    started, session.turn_started = session.turn_started, None
+    timings, session.turn_timings = session.turn_timings, {}
+    trace, session.trace = session.trace, None
+    if started is None:
+        return
+    timings["turn"] = time.perf_counter() - started
+    TURNS.inc()
+    for stage, seconds in timings.items():
+        TURN_STAGE_SECONDS.labels(stage).observe(seconds)
+    if trace is not None:
+        traces.append(trace)
+    if not session.report_timings:
+        return
+    await websocket.send_text(json.dumps({
+        "type": "turn_timings",
+        "timings_ms": {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+    }))
+
+
+async def send_busy(websocket, stage, message):
+    await websocket.send_text(json.dumps({
+        "type": "busy",
+        "stage": stage,
+        "message": message,
+        "retry_after": BUSY_RETRY_SECONDS
+    }))
+
+
+async def single_sentence(text):
+    yield text
+
+
+async def drain_sentences(queue):
+    while (sentence := await queue.get()) is not None:
+        yield sentence
+
+
+async def stream_assistant_reply(websocket, session, sentences):
+    """
+    Speaks `sentences` (an async iterator of text) as they arrive. Audio is
+    forwarded chunk by chunk; each chunk carries the reply id and a sequence
+    number (an 8-byte big-endian header on binary frames) and the reply
+    finishes with an audio_stream_end marker. Sentences after the first are
+    announced with assistant_text messages. If TTS is overloaded the rest of
+    the reply is sent as text only.
+    """
+    session.reply_seq += 1
+    reply_id = session.reply_seq
+    seq = 0
+    started = False
+    shed = False
+
+    async for sentence in sentences:
+        priority = PRIORITY_FOLLOWUP if started else PRIORITY_FINAL
+        await websocket.send_text(json.dumps({
+            "type": "assistant_text" if started else "assistant_reply",
+            "text": sentence,
+            "streaming": True,
+            "reply_id": reply_id
+        }))
+        started = True
+        if shed:
+            continue
+
+        tts_start = time.perf_counter()
+        send_seconds = 0.0
+        try:
+            async for chunk in stream_tts(sentence, priority):
+                send_start = time.perf_counter()
+                if seq == 0:
+                    session.add_timing("tts_first_byte", send_start - tts_start)
+                    mark_first_audio(session)
+                if session.binary_protocol:
+                    await websocket.send_bytes(struct.pack(">II", reply_id, seq) + chunk)
+                else:
                     await websocket.send_text(json.dumps({
-                        "type": "assistant_reply",
-                        "text": "Sorry, I had trouble processing that. Could you please repeat?"
+                        "type": "audio_stream",
+                        "reply_id": reply_id,
+                        "seq": seq,
+                        "audio_b64": base64.b64encode(chunk).decode("utf-8")
                     }))
-                    audio_buffer = b""
-                    continue
+                session.last_assistant_tts_time = time.time()
+                seq += 1
+                send_seconds += time.perf_counter() - send_start
+        except Overloaded:
+            # The text is on screen already; the rest of the reply goes without audio
+            await send_busy(websocket, "tts", "Voice replies are busy right now, answering in text.")
+            shed = True
+            continue
+        session.add_timing("tts", time.perf_counter() - tts_start - send_seconds)
+        session.add_timing("send", send_seconds)
 
-                if interrupted:
-                    print("🔄 Skipping outdated assistant reply.")
-                    interrupted = False
-                    audio_buffer = b""
-                    continue
+    if started:
+        await websocket.send_text(json.dumps({
+            "type": "audio_stream_end",
+            "reply_id": reply_id,
+            "chunks": seq
+        }))
+        await report_turn_timings(websocket, session)
+
+
+async def speak(websocket, session, text, sentences=None):
+    """
+    Starts delivering an assistant reply with audio and returns the task
+    doing it, which barge-in cancels. Streaming clients get audio as it is
+    synthesized, sentence by sentence when `sentences` is given; others get
+    the whole clip in one message.
+    """
+    if session.stream_tts:
+        task = asyncio.create_task(
+            stream_assistant_reply(websocket, session, sentences or single_sentence(text))
+        )
+    else:
+        tts_start = time.perf_counter()
+        try:
+            # Streamed from the API even here, so cancelling the turn stops the synthesis too.
+            # Cached phrases are joined as audio rather than synthesized again as one text.
+            audio_bytes = b"".join([
+                chunk for sentence in split_cached_phrases(text) async for chunk in stream_tts(sentence)
+            ])
+            session.add_timing("tts", time.perf_counter() - tts_start)
+            session.last_assistant_tts_time = time.time()
+        except Overloaded:
+            await send_busy(websocket, "tts", "Voice replies are busy right now, answering in text.")
+            audio_bytes = None
+        task = asyncio.create_task(send_assistant_reply(websocket, session, text, audio_bytes))
+
+    def clear(done_task):
+        if session.currently_playing_audio is done_task:
+            session.currently_playing_audio = None
+
+    session.currently_playing_audio = task
+    task.add_done_callback(clear)
+    return task
+
+
+async def handle_utterance(websocket, session, transcriber, samples):
+    """
+    Runs one user turn on 16 kHz float32 samples: transcribe (finishing
+    what `transcriber` heard while they were spoken), update the form,
+    reply. Returns True once the conversation is over. Runs as its own
+    task (see start_turn) so that barge-in can cancel every stage of it.
+    """
+    duration_seconds = len(samples) / ASR_SAMPLE_RATE
+    if duration_seconds > MAX_UTTERANCE_SECONDS:
+        print(f"🛑 Audio too long (>{MAX_UTTERANCE_SECONDS}s), skipping.")
+        SHED.labels("utterance").inc()
+        transcriber.reset()
+        await websocket.send_text(json.dumps({
+            "type": "utterance_too_long",
+            "max_seconds": MAX_UTTERANCE_SECONDS
+        }))
+        return False
 
-                if not assistant_text.strip():
-                    print("⚠️ Empty assistant message. Skipping TTS.")
-                    audio_buffer = b""
+    if time.time() - session.last_assistant_tts_time < 1.0:
+        print("🛑 Skipping input: too soon after TTS.")
+        transcriber.reset()
+        return False
+
+    session.start_turn()
+
+    # Whisper takes the float32 array directly: no WAV file, no ffmpeg decode.
+    # With streaming ASR most of the utterance is already committed and only the tail is decoded.
+    session.turn_stage = "asr"
+    asr_start = time.perf_counter()
+    try:
+        transcript = await transcriber.final(samples)
+    except asyncio.CancelledError:
+        # The user spoke again before we heard this; transcribe it together with what comes next
+        session.carryover_samples = samples
+        raise
+    except Overloaded:
+        transcriber.reset()
+        await send_busy(websocket, "asr", "Sorry, I'm handling a lot of calls right now. Please say that again.")
+        return False
+    session.add_timing("asr", time.perf_counter() - asr_start)
+    transcriber.reset()
+
+    if not transcript or len(transcript.split()) < 2 or transcript.lower().count("sí") > 8:
+        print("🛑 Ignoring hallucinated transcript.")
+        return False
+
+    print("🎤 User said:", transcript)
+    await websocket.send_text(json.dumps({
+        "type": "transcript",
+        "text": transcript
+    }))
+
+    # Streaming clients start hearing the reply as soon as its first sentence is generated
+    sentence_queue = asyncio.Queue() if session.stream_tts else None
+    reply_task = None
+
+    async def on_sentence(sentence):
+        nonlocal reply_task
+        if reply_task is None:
+            reply_task = await speak(websocket, session, None, drain_sentences(sentence_queue))
+        await sentence_queue.put(sentence)
+
+    session.turn_stage = "assistant"
+    try:
+        assistant_text = await asyncio.wait_for(
+            process_transcribed_text(session, transcript, on_sentence=on_sentence if sentence_queue else None),
+            timeout=10.0
+        )
+        if not assistant_text:
+            raise ValueError("No assistant response.")
+    except Exception as e:
+        print("⚠️ Assistant failed:", e)
+        if reply_task:
+            reply_task.cancel()
+        await speak(websocket, session, PROCESSING_ERROR_REPLY)
+        return False
+
+    if not assistant_text.strip():
+        print("⚠️ Empty assistant message. Skipping TTS.")
+        if reply_task:
+            reply_task.cancel()
+        return False
+
+    print("🤖 Assistant:", assistant_text)
+    if reply_task:
+        await sentence_queue.put(None)
+    else:
+        reply_task = await speak(websocket, session, assistant_text)
+    ending = "END OF CONVERSATION" in assistant_text.upper()
+
+    session.turn_stage = "playback"
+    # While the reply plays, so the write stays off the turn's critical path
+    await sessions.save(session)
+    await asyncio.wait([reply_task])
+
+    if ending:
+        print("✅ Ending session...")
+        return True
+    return False
+
+
+async def run_turn(websocket, session, transcriber, samples):
+    try:
+        ended = await handle_utterance(websocket, session, transcriber, samples)
+    except Exception as e:
+        print("❌ Turn failed:", e)
+        return
+    finally:
+        transcriber.reset()  # stops a partial pass still running if the turn was cancelled
+    if ended:
+        # The receive loop sees the disconnect and cleans up
+        await websocket.close()
+
+
+def start_turn(websocket, session, transcriber, samples):
+    """
+    Answers the utterance in the background so the receive loop keeps
+    listening for barge-in. The turn owns `transcriber` from here on; the
+    connection listens on with a new one.
+    """
+    if session.websocket is not websocket:
+        transcriber.reset()
+        return  # taken over by a newer connection
+    cancel_turn(session)
+    if session.carryover_samples is not None:
+        # Only as much of the earlier utterance as still fits next to this one; its end is what led into it
+        room = MAX_UTTERANCE_SECONDS * ASR_SAMPLE_RATE - len(samples)
+        if room > 0:
+            samples = np.concatenate([session.carryover_samples[-room:], samples])
+        session.carryover_samples = None
+        # The partials committed text against the new utterance alone; decode the joined audio from scratch
+        transcriber.reset()
+    session.turn_stage = None
+    session.turn_task = asyncio.create_task(run_turn(websocket, session, transcriber, samples))
+
+
+def cancel_turn(session):
+    """
+    Drops the turn in progress: a queued ASR request leaves the batch
+    queue, the LLM request is aborted and TTS synthesis and playback stop.
+    Returns True if assistant audio was playing.
+    """
+    turn = session.turn_task
+    if turn is not None and not turn.done():
+        CANCELLED_TURNS.labels(session.turn_stage or "asr").inc()
+        turn.cancel()
+    session.turn_task = None
+    playing = session.currently_playing_audio
+    session.currently_playing_audio = None
+    if playing is not None and not playing.done():
+        playing.cancel()
+        return True
+    return False
+
+
+@router.websocket("/ws/audio")
+async def audio_websocket(websocket: WebSocket):
+    await websocket.accept()
+    if not registry.ready:
+        # Refuse rather than accept a caller we can't serve yet
+        await websocket.send_text(json.dumps({
+            "type": "unavailable",
+            "message": "The assistant is starting up, please try again shortly.",
+            "status": registry.status
+        }))
+        await websocket.close(code=1013)  # Try Again Later
+        return
+    try:
+        # Taken before the first await below, so callers connecting at once can't all squeeze in
+        async with connection_limiter.slot():
+            await serve_audio(websocket)
+    except Overloaded as e:
+        if e.stage != "session":
+            raise
+        await send_busy(websocket, "session", "All lines are busy, please try again shortly.")
+        await websocket.close(code=1013)
+
+
+async def serve_audio(websocket):
+    """Runs one admitted /ws/audio connection until the caller hangs up."""
+    session = await sessions.get_or_create(websocket.query_params.get("session_id"))
+    previous = session.websocket
+    if previous is not None:
+        # A duplicated tab, or a reconnect before the old socket was noticed closing: the newest one wins
+        cancel_turn(session)
+        try:
+            await previous.send_text(json.dumps({"type": "replaced"}))
+            await previous.close(code=4000)
+        except Exception:
+            pass
+    session.connections += 1
+    session.websocket = websocket
+    session.binary_protocol = websocket.query_params.get("protocol") == "binary"
+    session.stream_tts = websocket.query_params.get("tts") == "stream"
+    session.report_timings = websocket.query_params.get("timings") == "1"
+    session.carryover_samples = None
+    # Each connection gets its own capture pipeline, so an old socket can't touch the new one's
+    vad = StreamingVAD(ASR_SAMPLE_RATE)
+    transcriber = StreamingTranscriber(asr_worker.transcribe, ASR_SAMPLE_RATE)
+    resampler = StreamingResampler(INPUT_SAMPLE_RATE, ASR_SAMPLE_RATE)
+    audio_buffer = PCMBuffer()  # 16 kHz float32 samples
+    preroll_bytes = ASR_SAMPLE_RATE * 4 * VAD_PREROLL_MS // 1000
+    discarding = False  # the current utterance ran over MAX_UTTERANCE_BYTES; ignore it until it ends
+
+    try:
+        await websocket.send_text(json.dumps({
+            "type": "session",
+            "session_id": session.session_id
+        }))
+
+        # Resume an existing conversation by repeating the last question
+        if session.conversation_history and session.last_assistant_msg:
+            initial_text = session.last_assistant_msg
+        else:
+            initial_text = get_initial_assistant_message(session)
+            await sessions.save(session)
+        await speak(websocket, session, initial_text)
+
+        def capture(chunk):
+            # Runs on a VAD thread so scoring frames doesn't hold up the event loop
+            stage_start = time.perf_counter()
+            samples = resampler.process(chunk)
+            resampled_at = time.perf_counter()
+            events = vad.feed(samples)
+            return samples, events, resampled_at - stage_start, time.perf_counter() - resampled_at
+
+        async def send_partial(text):
+            await websocket.send_text(json.dumps({
+                "type": "partial_transcript",
+                "text": text
+            }))
+
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect" or session.websocket is not websocket:
+                break
+            session.touch()
+
+            # Binary frames carry raw int16 PCM; text frames carry JSON control messages
+            if msg.get("bytes") is not None:
+                data = {"type": "audio_chunk"}
+                chunk = msg["bytes"]
+            else:
+                data = json.loads(msg["text"])
+                chunk = None
+
+            if data["type"] == "audio_chunk":
+                if chunk is None:
+                    chunk = base64.b64decode(data["data"])
+                if len(chunk) > MAX_CHUNK_BYTES:
+                    SHED.labels("frame").inc()
+                    await websocket.send_text(json.dumps({"type": "error", "message": "Audio frame too large."}))
                     continue
+                samples, events, resample_seconds, vad_seconds = await run_in_vad_thread(capture, chunk)
+                if not discarding:
+                    audio_buffer.append(samples)
+                RESAMPLE_SECONDS.observe(resample_seconds)
+                VAD_SECONDS.observe(vad_seconds)
+                if "speech_start" in events:
+                    # The next turn's resample/VAD time is this utterance's, not the silence or playback before it
+                    session.listen_timings.clear()
+                session.add_timing("resample", resample_seconds, listening=True)
+                session.add_timing("vad", vad_seconds, listening=True)
 
-                print("🤖 Assistant:", assistant_text)
-                tts_task = asyncio.to_thread(generate_tts, assistant_text)
-                audio_bytes = await tts_task
-                audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-                last_assistant_tts_time = time.time()
+                if "speech_start" in events and cancel_turn(session):
+                    await websocket.send_text(json.dumps({"type": "interrupt_audio"}))
+                    print("⛔️ Assistant TTS interrupted by user.")
 
-                async def send_reply():
+                if "speech_end" in events:
+                    await websocket.send_text(json.dumps({"type": "speech_end"}))
+                    if discarding:
+                        discarding = False
+                        continue
+                    utterance = np.frombuffer(audio_buffer.getvalue(), np.float32)
+                    audio_buffer.clear()
+                    start_turn(websocket, session, transcriber, utterance)
+                    transcriber = StreamingTranscriber(asr_worker.transcribe, ASR_SAMPLE_RATE)
+                elif not vad.triggered:
+                    # Only keep a short pre-roll while nobody is speaking
+                    audio_buffer.keep_tail(preroll_bytes)
+                elif len(audio_buffer) > MAX_UTTERANCE_BYTES:
+                    # Too long to answer; stop buffering now rather than when the speaker stops
+                    SHED.labels("utterance").inc()
+                    print(f"🛑 Audio too long (>{MAX_UTTERANCE_SECONDS}s), discarding.")
+                    discarding = True
+                    audio_buffer.clear()
+                    transcriber.reset()
                     await websocket.send_text(json.dumps({
-                        "type": "assistant_reply",
-                        "text": assistant_text,
-                        "audio_b64": audio_b64
+                        "type": "utterance_too_long",
+                        "max_seconds": MAX_UTTERANCE_SECONDS
                     }))
+                elif STREAMING_ASR and transcriber.should_update(len(audio_buffer) // 4):
+                    partial_samples = np.frombuffer(audio_buffer.getvalue(), np.float32)
+                    transcriber.start_partial(partial_samples, send_partial)
 
-                currently_playing_audio = asyncio.create_task(send_reply())
-                await currently_playing_audio
-                currently_playing_audio = None
-                audio_buffer = b""
-
-                if "END OF CONVERSATION" in assistant_text.upper():
-                    print("✅ Ending session...")
-                    break
+            elif data["type"] == "end_stream":
+                # Client-side endpointing from older clients; the server VAD decides if it was speech
+                if not vad.triggered or discarding:
+                    print("🛑 VAD: No speech detected.")
+                    audio_buffer.clear()
+                    transcriber.reset()
+                    vad.reset()
+                    discarding = False
+                    continue
+                vad.reset()
+                utterance = np.frombuffer(audio_buffer.getvalue(), np.float32)
+                audio_buffer.clear()
+                start_turn(websocket, session, transcriber, utterance)
+                transcriber = StreamingTranscriber(asr_worker.transcribe, ASR_SAMPLE_RATE)
 
     except Exception as e:
         print("❌ WebSocket error:", e)
@@ -161,3 +645,12 @@ async def audio_websocket(websocket: WebSocket):
             await websocket.send_text(json.dumps({ "type": "error", "message": str(e) }))
         except RuntimeError:
             print("⚠️ Skipped sending error: client already disconnected.")
+    finally:
+        transcriber.reset()
+        session.connections -= 1
+        # Unless a newer connection took the session over, nobody is listening for the answer any more
+        if session.websocket is websocket:
+            cancel_turn(session)
+            session.websocket = None
+        session.touch()
+        await sessions.save(session)